@@ -0,0 +1,26 @@
+from django.core.cache import cache
+
+
+JWT_USER_KEY = 'account.jwt_user:{user_id}'
+
+# only meant to absorb bursts of socket handshakes; user changes invalidate it eagerly
+JWT_USER_TIMEOUT = 60
+
+
+def get_jwt_user(user_id, issued_at):
+    """
+    Return the cached user for a token of user_id issued at issued_at, or None.
+    """
+    snapshots = cache.get(JWT_USER_KEY.format(user_id=user_id)) or {}
+    return snapshots.get(issued_at)
+
+
+def set_jwt_user(user, issued_at):
+    key = JWT_USER_KEY.format(user_id=user.id)
+    snapshots = cache.get(key) or {}
+    snapshots[issued_at] = user
+    cache.set(key, snapshots, JWT_USER_TIMEOUT)
+
+
+def invalidate_jwt_user(user_id):
+    cache.delete(JWT_USER_KEY.format(user_id=user_id))
@@ -1,12 +1,11 @@
 from datetime import timedelta
 
 from django.utils import timezone
-from zoneinfo import ZoneInfo
 from django.contrib.auth import get_user_model
 from django_cron import CronJobBase, Schedule
 
-from account.models import AppSession
-from notification.models import Notification, NotificationActor
+from account.models import AppSession, get_next_daily_noti_at, get_zone
+from notification.models import Notification
 from qna.models import Question
 
 
@@ -14,9 +13,11 @@ User = get_user_model()
 
 SESSION_TIMEOUT_MINUTES = 2 
 
+DAILY_NOTI_WINDOW = timedelta(minutes=10)
+
 
 class SendDailyWhoAmINotiCronJob(CronJobBase):
-    schedule = Schedule(run_every_mins=0)
+    schedule = Schedule(run_every_mins=15)
     code = 'account.send_daily_who_am_i_noti_cron_job'
 
     def do(self):
@@ -25,53 +26,60 @@ class SendDailyWhoAmINotiCronJob(CronJobBase):
 
         admin = User.objects.filter(is_superuser=True).get(email='whoami.today.official@gmail.com')
 
-        num_notis_before = Notification.objects.admin_only().count()
-        all_users = User.objects.all()
-
-        for user in all_users:
-            if user.noti_time is None:
-                continue
-
-            user_local_time = timezone.now().astimezone(ZoneInfo(user.timezone))
-            
-            current_weekday = user_local_time.weekday()  # Monday=0, Sunday=6
-            if str(current_weekday) not in user.noti_period_days:
-                continue
-
-            try:
-                daily_question = Question.objects.daily_questions(user)[0]
-                daily_question_en = daily_question.content_en
-                daily_question_ko = daily_question.content_ko
-                daily_question_id = daily_question.id
-            except:
+        now = timezone.now()
+
+        # users without a schedule yet (e.g. right after next_daily_noti_at was added) are scheduled first
+        unscheduled = list(User.objects.filter(noti_time__isnull=False, next_daily_noti_at__isnull=True)
+                           .only('id', 'timezone', 'noti_time', 'noti_period_days', 'next_daily_noti_at'))
+        for user in unscheduled:
+            user.next_daily_noti_at = get_next_daily_noti_at(user.timezone, user.noti_time, user.noti_period_days,
+                                                             after=now)
+        User.objects.bulk_update(unscheduled, ['next_daily_noti_at'], batch_size=1000)
+
+        daily_questions = {}  # user local date -> daily question (None if there is none)
+        notifications = []
+        # the job runs every 15 minutes, so notifications due within the next DAILY_NOTI_WINDOW are sent now
+        due_users = list(User.objects.filter(noti_time__isnull=False, next_daily_noti_at__lte=now + DAILY_NOTI_WINDOW)
+                         .only('id', 'username', 'timezone', 'noti_time', 'noti_period_days', 'current_ver',
+                               'next_daily_noti_at'))
+
+        for user in due_users:
+            noti_at = user.next_daily_noti_at
+            # reschedule first, so that a user is never notified twice for the same day
+            user.next_daily_noti_at = get_next_daily_noti_at(user.timezone, user.noti_time, user.noti_period_days,
+                                                             after=max(noti_at, now))
+            if now - noti_at > DAILY_NOTI_WINDOW:
+                continue  # missed (e.g. the job did not run); skip instead of notifying at the wrong time
+
+            user_today = noti_at.astimezone(get_zone(user.timezone)).date()
+            if user_today not in daily_questions:
+                daily_questions[user_today] = Question.objects.date_questions(user_today).first()
+            daily_question = daily_questions[user_today]
+            if daily_question is None:
                 print(f'🚨 ERROR: daily question does not exist for user {user.username} ({user.id})!')
                 print("Failed to send daily notification for this user.")
                 continue
 
-            user_now = user_local_time
-            noti_datetime = user_now.replace(hour=user.noti_time.hour, minute=user.noti_time.minute)
-            time_diff = abs(user_now - noti_datetime)
-            if time_diff <= timedelta(minutes=10):
-                # daily notification
-                if user.current_ver == 'default':
-                    noti = Notification.objects.create(user=user,
-                                                    target=admin,
-                                                    origin=admin,
-                                                    message_ko=f"{user.username}님, 오늘 친구들에게 한 마디 남겨보세요!",
-                                                    message_en=f"{user.username}, quick reminder to share something with your friends today!",
-                                                    redirect_url=f'/friends/feed')
-                    NotificationActor.objects.create(user=admin, notification=noti)
-                elif user.current_ver == 'experiment':
-                    noti = Notification.objects.create(user=user,
-                                                    target=admin,
-                                                    origin=admin,
-                                                    message_ko=f"{user.username}님, 오늘 친구들에게 한 마디 남겨보세요! — {daily_question_ko}",
-                                                    message_en=f"{user.username}, quick reminder to share something with your friends today! — {daily_question_en}",
-                                                    redirect_url=f'/questions/{daily_question_id}/new')
-                    NotificationActor.objects.create(user=admin, notification=noti)
-
-        num_notis_after = Notification.objects.admin_only().count()
-        print(f'{num_notis_after - num_notis_before} notifications sent!')
+            # daily notification
+            if user.current_ver == 'default':
+                notifications.append(Notification(user=user,
+                                                  target=admin,
+                                                  origin=admin,
+                                                  message_ko=f"{user.username}님, 오늘 친구들에게 한 마디 남겨보세요!",
+                                                  message_en=f"{user.username}, quick reminder to share something with your friends today!",
+                                                  redirect_url=f'/friends/feed'))
+            elif user.current_ver == 'experiment':
+                notifications.append(Notification(user=user,
+                                                  target=admin,
+                                                  origin=admin,
+                                                  message_ko=f"{user.username}님, 오늘 친구들에게 한 마디 남겨보세요! — {daily_question.content_ko}",
+                                                  message_en=f"{user.username}, quick reminder to share something with your friends today! — {daily_question.content_en}",
+                                                  redirect_url=f'/questions/{daily_question.id}/new'))
+
+        User.objects.bulk_update(due_users, ['next_daily_noti_at'], batch_size=1000)
+        Notification.objects.bulk_create_notifications(admin, notifications)
+
+        print(f'{len(notifications)} notifications sent!')
         print('=========================')
         print("Cron job complete...............")
         print('=========================')
@@ -87,32 +95,30 @@ class SendDailySurveyNotiCronJob(CronJobBase):
 
         admin = User.objects.filter(is_superuser=True).get(email='whoami.today.official@gmail.com')
 
-        num_notis_before = Notification.objects.admin_only().count()
-        all_users = User.objects.all()
-
-        for user in all_users:
-            user_local_time = timezone.now().astimezone(ZoneInfo(user.timezone))
-            user_now = user_local_time
+        now = timezone.now()
+        notifications = []
+        for user in User.objects.only('id', 'username', 'timezone'):
+            user_now = now.astimezone(get_zone(user.timezone))
             noti_time = user_now.replace(hour=20, minute=0, second=0, microsecond=0)
             time_diff = abs(user_now - noti_time)
             if time_diff <= timedelta(minutes=10):
-                noti = Notification.objects.create(user=user,
-                                                target=admin,
-                                                origin=admin,
-                                                message_ko=f"{user.username}님, 데일리 설문을 작성해주세요!",
-                                                message_en=f"{user.username}, time to fill out the daily survey!",
-                                                redirect_url=f'')
-                NotificationActor.objects.create(user=admin, notification=noti)
-
-        num_notis_after = Notification.objects.admin_only().count()
-        print(f'{num_notis_after - num_notis_before} notifications sent!')
+                notifications.append(Notification(user=user,
+                                                  target=admin,
+                                                  origin=admin,
+                                                  message_ko=f"{user.username}님, 데일리 설문을 작성해주세요!",
+                                                  message_en=f"{user.username}, time to fill out the daily survey!",
+                                                  redirect_url=f''))
+
+        Notification.objects.bulk_create_notifications(admin, notifications)
+
+        print(f'{len(notifications)} notifications sent!')
         print('=========================')
         print("Cron job complete...............")
         print('=========================')
 
 
 class AutoCloseSessionsCronJob(CronJobBase):
-    schedule = Schedule(run_every_mins=0)
+    schedule = Schedule(run_every_mins=1)
     code = "session.auto_close_sessions"
 
     def do(self):
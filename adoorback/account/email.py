@@ -1,17 +1,15 @@
 import datetime
 import six
-import traceback
 
 from django.conf import settings
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.core.mail import EmailMessage
 from django.utils import timezone
 from django.utils.crypto import constant_time_compare
 from django.utils.encoding import force_bytes
 from django.utils.http import base36_to_int, urlsafe_base64_encode
 from django.utils.translation import gettext_lazy as _
 
-from adoorback.utils.alerts import send_msg_to_slack
+from task.mail import queue_email
 
 
 class ActivateTokenGenerator(PasswordResetTokenGenerator):
@@ -68,15 +66,7 @@ class EmailManager():
         message_data = _("이메일 인증을 위해 아래 링크를 클릭해주세요.\n\n이메일 인증 링크: ")
         message_data += f"{settings.FRONTEND_URL}/activate/{uid}/{token}/\n\n"
         message_data += _("감사합니다.")
-        email = EmailMessage(mail_title, message_data, to=mail_to)
-        try:
-            email.send(fail_silently=False)
-        except Exception as e:
-            tb = traceback.format_exc()
-            send_msg_to_slack(
-                text=f"*⚠️ 이메일 인증 이메일 전송 실패*\n```{tb}```",
-                level="WARNING"
-            )
+        queue_email(mail_title, message_data, mail_to)
 
 
     def send_reset_password_email(self, user):
@@ -90,8 +80,7 @@ class EmailManager():
         message_data += _("님, 아래 링크를 클릭하면 비밀번호 변경이 가능합니다.\n\n비밀번호 변경 링크: ")
         message_data += f"{settings.FRONTEND_URL}/reset-password/{uid}/{token}\n\n"
         message_data += _("감사합니다.")
-        email = EmailMessage(mail_title, message_data, to=mail_to)
-        email.send()
+        queue_email(mail_title, message_data, mail_to)
 
     def check_activate_token(self, user, token):
         return self.activate_token_generator.check_token(user, token)
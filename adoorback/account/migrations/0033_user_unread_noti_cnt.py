@@ -0,0 +1,29 @@
+# Generated by Django 4.2.14 on 2026-10-19 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0032_alter_user_current_ver_alter_user_user_type'),
+        ('notification', '0010_notification_aggregation_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='unread_noti_cnt',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE account_user AS u SET unread_noti_cnt = (
+                    SELECT COUNT(*) FROM notification_notification AS n
+                    WHERE n.user_id = u.id AND n.is_visible AND NOT n.is_read AND n.deleted IS NULL
+                        AND (u.ver_changed_at IS NULL OR n.created_at >= u.ver_changed_at)
+                );
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
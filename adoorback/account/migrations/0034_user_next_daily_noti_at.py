@@ -0,0 +1,18 @@
+# Generated by Django 4.2.14 on 2026-10-19 15:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0033_user_unread_noti_cnt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='next_daily_noti_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
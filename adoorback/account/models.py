@@ -1,9 +1,10 @@
-from datetime import time
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 import glob
 import os
 import secrets
 import urllib.parse
 import uuid
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from django.apps import apps
 from django.conf import settings
@@ -15,7 +16,7 @@ from django.core.exceptions import ValidationError
 from django.core.files.storage import FileSystemStorage
 from django.contrib.postgres.fields import ArrayField
 from django.db import models, transaction
-from django.db.models import Max, Q
+from django.db.models import Exists, Max, OuterRef, Q
 from django.db.models.signals import post_save, post_delete
 from django.db.utils import IntegrityError
 from django.dispatch import receiver
@@ -26,10 +27,12 @@ from safedelete import DELETED_INVISIBLE
 from safedelete.models import SafeDeleteModel, SOFT_DELETE_CASCADE, HARD_DELETE
 from safedelete.managers import SafeDeleteManager
 
+from .cache import invalidate_jwt_user
 from .email import email_manager
 from adoorback.models import AdoorTimestampedModel
 from adoorback.utils.validators import AdoorUsernameValidator
-from notification.models import NotificationActor
+from notification.models import NotificationActor, refresh_unread_noti_cnt
+from task.queue import task
 
 
 GENDER_CHOICES = (
@@ -134,10 +137,42 @@ def default_noti_period_days():
 def default_persona():
     return []
 
+
+def get_zone(timezone_name):
+    """
+    ZoneInfo of a user's timezone, falling back to TIME_ZONE for values that are not valid zone names.
+    """
+    try:
+        return ZoneInfo(timezone_name)
+    except (ZoneInfoNotFoundError, ValueError, TypeError):
+        return ZoneInfo(settings.TIME_ZONE)
+
+
+def get_next_daily_noti_at(timezone_name, noti_time, noti_period_days, after):
+    """
+    First daily notification time (in UTC) strictly after `after`, or None if the user gets none.
+    noti_period_days holds weekdays as strings of datetime.weekday() (Monday=0).
+    """
+    if noti_time is None or not noti_period_days:
+        return None
+    user_tz = get_zone(timezone_name)
+    local_after = after.astimezone(user_tz)
+    for days in range(8):
+        day = local_after.date() + timedelta(days=days)
+        if str(day.weekday()) not in noti_period_days:
+            continue
+        noti_at = datetime.combine(day, noti_time, tzinfo=user_tz)
+        if noti_at > local_after:
+            return noti_at.astimezone(dt_timezone.utc)
+    return None
+
 def default_username_history():
     return []
 
 
+DAILY_NOTI_FIELDS = {'timezone', 'noti_time', 'noti_period_days'}
+
+
 class UserCustomManager(UserManager, SafeDeleteManager):
     _safedelete_visibility = DELETED_INVISIBLE
 
@@ -187,7 +222,12 @@ class User(AbstractUser, AdoorTimestampedModel, SafeDeleteModel):
     favorites = models.ManyToManyField('self', symmetrical=False, related_name='favorite_of', blank=True)
     hidden = models.ManyToManyField('self', symmetrical=False, related_name='hidden_by', blank=True)
 
+    # when the daily notification is due next, derived from timezone, noti_time and noti_period_days
+    next_daily_noti_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
     ver_changed_at = models.DateTimeField(null=True)
+    # visible unread notifications since ver_changed_at; kept up to date by notification.models
+    unread_noti_cnt = models.IntegerField(default=0)
     current_ver = models.CharField(max_length=20, choices=VERSION_CHOICES, default='experiment')
     user_group = models.CharField(max_length=20, choices=USER_GROUP_CHOICES, default='group_1')
     user_type = models.CharField(max_length=20, choices=USER_TYPE_CHOICES, default='indirect')
@@ -233,12 +273,33 @@ class User(AbstractUser, AdoorTimestampedModel, SafeDeleteModel):
 
     def __str__(self):
         return self.username
-    
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if not instance.get_deferred_fields().intersection(DAILY_NOTI_FIELDS):
+            instance._loaded_daily_noti_schedule = instance.daily_noti_schedule
+        if 'profile_image' not in instance.get_deferred_fields() and instance.profile_image:
+            instance._loaded_profile_image_name = os.path.basename(instance.profile_image.name)
+        return instance
+
+    @property
+    def daily_noti_schedule(self):
+        return self.timezone, self.noti_time, list(self.noti_period_days or [])
+
     def save(self, *args, **kwargs):
         # add initial username to username_history
         if not self.pk and self.username and not self.username_history:
             self.username_history = [self.username]
 
+        # reschedule the daily notification when its settings change
+        if not self.get_deferred_fields().intersection(DAILY_NOTI_FIELDS) and \
+                (self._state.adding or self.daily_noti_schedule != getattr(self, '_loaded_daily_noti_schedule', None)):
+            self.next_daily_noti_at = get_next_daily_noti_at(*self.daily_noti_schedule, after=timezone.now())
+            self._loaded_daily_noti_schedule = self.daily_noti_schedule
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'next_daily_noti_at'}
+
         # Ensure that only connected users can be added to favorites or hidden
         if self.id is not None:  # Existing user
             current_connected_users = set(self.connected_user_ids)
@@ -248,6 +309,14 @@ class User(AbstractUser, AdoorTimestampedModel, SafeDeleteModel):
             if not new_favorites.issubset(current_connected_users) or not new_hidden.issubset(current_connected_users):
                 raise ValueError("Favorites and hidden must be among the user's connected users.")
 
+        # unread_noti_cnt is only changed by atomic UPDATEs (see notification/models.py);
+        # writing back the value loaded with the instance would undo the ones committed since
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred_fields = self.get_deferred_fields()
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.attname not in deferred_fields
+                                       and field.name != 'unread_noti_cnt']
+
         super().save(*args, **kwargs)
 
     def safe_delete(self):
@@ -256,6 +325,7 @@ class User(AbstractUser, AdoorTimestampedModel, SafeDeleteModel):
         for noti in self.received_noti_set.all():
             noti.delete()
         self.delete()
+        invalidate_jwt_user(self.id)
 
     @classmethod
     def user_read(cls, user1, user2):
@@ -620,6 +690,32 @@ class Subscription(AdoorTimestampedModel, SafeDeleteModel):
     def __str__(self):
         return f'{self.subscriber} subscribed to {self.content_type} of {self.subscribed_to}'
 
+    @classmethod
+    def audience_subscriber_ids(cls, post):
+        """
+        Ids of the users subscribed to posts like post who can see it, in one query.
+        Same rules as is_audience for a post that was just created (so it has no content reports
+        and is newer than any close friend upgrade).
+        """
+        from user_report.models import UserReport
+        author = post.author
+        subscriber = OuterRef('subscriber')
+
+        if post.visibility == 'close_friends':
+            connections = Connection.objects.filter(Q(user1=author, user2=subscriber, user1_choice='close_friend') |
+                                                    Q(user1=subscriber, user2=author, user2_choice='close_friend'))
+        else:
+            connections = Connection.objects.filter(Q(user1=author, user2=subscriber) |
+                                                    Q(user1=subscriber, user2=author))
+        reports = UserReport.objects.filter(Q(user=author, reported_user=subscriber) |
+                                            Q(user=subscriber, reported_user=author))
+
+        return cls.objects.filter(
+            subscribed_to=author,
+            content_type=ContentType.objects.get_for_model(post),
+            subscriber__deleted__isnull=True,
+        ).filter(Exists(connections)).exclude(Exists(reports)).values_list('subscriber_id', flat=True)
+
 
 class AppSession(SafeDeleteModel):
     user = models.ForeignKey(
@@ -651,8 +747,10 @@ def connection_removed(instance, **kwargs):
     user2 = instance.user2
 
     # 1. Remove friendship related notis from both users
-    user1.friendship_targetted_notis.filter(user=user2).delete(force_policy=HARD_DELETE)
-    user2.friendship_targetted_notis.filter(user=user1).delete(force_policy=HARD_DELETE)
+    # (soft deleted, so that NotificationDelta reports them as removed)
+    user1.friendship_targetted_notis.filter(user=user2).delete()
+    user2.friendship_targetted_notis.filter(user=user1).delete()
+    refresh_unread_noti_cnt([user1.id, user2.id])
     FriendRequest.objects.filter(requester=user1, requestee=user2).delete(force_policy=HARD_DELETE)
     FriendRequest.objects.filter(requester=user2, requestee=user1).delete(force_policy=HARD_DELETE)
 
@@ -675,12 +773,51 @@ def connection_removed(instance, **kwargs):
         pass
 
     # 3. Inactivate chat rooms
+    from chat.cache import invalidate_chat_rooms
     from chat.models import ChatRoom
-    chat_rooms = ChatRoom.objects.filter(users__in=[user1, user2])
+    chat_rooms = ChatRoom.objects.filter(users=user1).filter(users=user2)
     for chat_room in chat_rooms:
         if chat_room.users.count() == 2:
             chat_room.active = False
             chat_room.save()
+    invalidate_chat_rooms(user_ids=[user1.id, user2.id])
+
+
+@task
+def create_friend_request_noti(friend_request_id):
+    friend_request = FriendRequest.objects.select_related('requester', 'requestee').filter(id=friend_request_id).first()
+    if friend_request is None or friend_request.accepted is not None:
+        return  # withdrawn or already responded to before the task ran
+    requester = friend_request.requester
+    requestee = friend_request.requestee
+
+    Notification = apps.get_model('notification', 'Notification')
+    noti = Notification.objects.create(user=requestee,
+                                       origin=requester, target=friend_request,
+                                       message_ko=f'{requester.username}님이 친구 요청을 보냈습니다.',
+                                       message_en=f'{requester.username} has sent a friend request.',
+                                       redirect_url=f'/users/{requester.username}')
+    NotificationActor.objects.create(user=requester, notification=noti)
+
+
+@task
+def create_new_friend_notis(requester_id, requestee_id):
+    requester = User.objects.get(id=requester_id)
+    requestee = User.objects.get(id=requestee_id)
+
+    Notification = apps.get_model('notification', 'Notification')
+    noti = Notification.objects.create(user=requestee,
+                                       origin=requester, target=requester,
+                                       message_ko=f'{requester.username}님과 친구가 되었습니다.',
+                                       message_en=f'You are now friends with {requester.username}.',
+                                       redirect_url=f'/users/{requester.username}')
+    NotificationActor.objects.create(user=requester, notification=noti)
+    noti = Notification.objects.create(user=requester,
+                                       origin=requestee, target=requestee,
+                                       message_ko=f'{requestee.username}님과 친구가 되었습니다.',
+                                       message_en=f'You are now friends with {requestee.username}.',
+                                       redirect_url=f'/users/{requestee.username}')
+    NotificationActor.objects.create(user=requestee, notification=noti)
 
 
 @transaction.atomic
@@ -690,7 +827,6 @@ def create_connection_noti(created, instance, **kwargs):
         return
 
     accepted = instance.accepted
-    Notification = apps.get_model('notification', 'Notification')
     requester = instance.requester
     requestee = instance.requestee
 
@@ -698,31 +834,15 @@ def create_connection_noti(created, instance, **kwargs):
         return
 
     if created:
-        noti = Notification.objects.create(user=requestee,
-                                           origin=requester, target=instance,
-                                           message_ko=f'{requester.username}님이 친구 요청을 보냈습니다.',
-                                           message_en=f'{requester.username} has sent a friend request.',
-                                           redirect_url=f'/users/{requester.username}')
-        NotificationActor.objects.create(user=requester, notification=noti)
+        create_friend_request_noti.delay(instance.id)
         return
     elif accepted:
         if requester.is_connected(requestee):  # receiver function was triggered by undelete
             return
 
-        noti = Notification.objects.create(user=requestee,
-                                           origin=requester, target=requester,
-                                           message_ko=f'{requester.username}님과 친구가 되었습니다.',
-                                           message_en=f'You are now friends with {requester.username}.',
-                                           redirect_url=f'/users/{requester.username}')
-        NotificationActor.objects.create(user=requester, notification=noti)
-        noti = Notification.objects.create(user=requester,
-                                           origin=requestee, target=requestee,
-                                           message_ko=f'{requestee.username}님과 친구가 되었습니다.',
-                                           message_en=f'You are now friends with {requestee.username}.',
-                                           redirect_url=f'/users/{requestee.username}')
-        NotificationActor.objects.create(user=requestee, notification=noti)
-
-        # make connection
+        create_new_friend_notis.delay(requester.id, requestee.id)
+
+        # make connection (right away, so that the response already shows the new friend)
         Connection.objects.create(
             user1=requester,
             user2=requestee,
@@ -743,52 +863,70 @@ def create_connection_noti(created, instance, **kwargs):
     # make friend request notification invisible once requestee has responded
     instance.friend_request_targetted_notis.filter(user=requestee,
                                                    actors__id=requester.id).update(is_read=True,
-                                                                                   is_visible=False)
+                                                                                   is_visible=False,
+                                                                                   updated_at=timezone.now())
+    refresh_unread_noti_cnt([requestee.id])
+
+
+@task
+def create_welcome_noti(user_id):
+    from notification.models import Notification
+    user = User.objects.get(id=user_id)
+    admin = User.objects.filter(is_superuser=True).first()
+    noti = Notification.objects.create(user=user,
+                                       target=admin,
+                                       origin=admin,
+                                       message_ko=f"{user.username}님, 보다 재밌는 후엠아이 이용을 위해 친구를 추가해보세요!",
+                                       message_en=f"{user.username}, add your friends for a better WIT experience!",
+                                       redirect_url='/friends/explore')
+    NotificationActor.objects.create(user=admin, notification=noti)
 
 
-@transaction.atomic
 @receiver(post_save, sender=User)
 def user_created(created, instance, **kwargs):
     '''
     when User is created, 
     1) send notification
     2) send verification email
+    (in the task and email workers, so that signing up does not wait on them)
     '''
     if instance.deleted:
         return
 
     if created:
-        # send notification
-        from notification.models import Notification
-        admin = User.objects.filter(is_superuser=True).first()
-        noti = Notification.objects.create(user=instance,
-                                           target=admin,
-                                           origin=admin,
-                                           message_ko=f"{instance.username}님, 보다 재밌는 후엠아이 이용을 위해 친구를 추가해보세요!",
-                                           message_en=f"{instance.username}, add your friends for a better WIT experience!",
-                                           redirect_url='/friends/explore')
-        NotificationActor.objects.create(user=admin, notification=noti)
+        create_welcome_noti.delay(instance.id)
 
     if created and instance.email:
         email_manager.send_verification_email(instance)
 
 
-@transaction.atomic
+@receiver(post_save, sender=User)
+def invalidate_cached_jwt_user(instance, **kwargs):
+    # covers profile edits, password changes (set_password + save) and soft deletion
+    invalidate_jwt_user(instance.id)
+
+
+@task
+def delete_old_profile_images(username, current_image_name):
+    profile_images_dir = os.path.join(settings.MEDIA_ROOT, 'profile_images')
+    current_hash = current_image_name.split('_')[-1].split('.')[0]
+
+    # username_{hash}.png 형태의 모든 파일을 찾습니다.
+    pattern = os.path.join(profile_images_dir, f'{username}_*.png')
+    existing_images = glob.glob(pattern)
+
+    for image_path in existing_images:
+        image_name = os.path.basename(image_path)
+        image_hash = image_name.split('_')[-1].split('.')[0]
+        if image_hash != current_hash:
+            os.remove(image_path)  # 해시 값이 다른 파일을 삭제합니다.
+
+
 @receiver(post_save, sender=User)
 def delete_old_profile_image(sender, instance, **kwargs):
-    if instance.pk:
-        if instance.profile_image:
-            profile_images_dir = os.path.join(settings.MEDIA_ROOT, 'profile_images')
-            current_image_name = os.path.basename(instance.profile_image.name)
-            current_hash = current_image_name.split('_')[-1].split('.')[0]
-
-            # username_{hash}.png 형태의 모든 파일을 찾습니다.
-            pattern = os.path.join(profile_images_dir, f'{instance.username}_*.png')
-            existing_images = glob.glob(pattern)
-            print(len(existing_images))
-
-            for image_path in existing_images:
-                image_name = os.path.basename(image_path)
-                image_hash = image_name.split('_')[-1].split('.')[0]
-                if image_hash != current_hash:
-                    os.remove(image_path)  # 해시 값이 다른 파일을 삭제합니다.
+    if instance.pk and 'profile_image' not in instance.get_deferred_fields() and instance.profile_image:
+        current_image_name = os.path.basename(instance.profile_image.name)
+        # only after the image changed, not on every save of the user
+        if current_image_name != getattr(instance, '_loaded_profile_image_name', None):
+            instance._loaded_profile_image_name = current_image_name
+            delete_old_profile_images.delay(instance.username, current_image_name)
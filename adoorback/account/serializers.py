@@ -2,6 +2,7 @@ import csv
 import json
 import os
 import traceback
+from zoneinfo import available_timezones
 
 from django.db import transaction
 from django.db.models import Count, Q
@@ -18,7 +19,6 @@ from adoorback.utils.alerts import send_msg_to_slack
 from adoorback.utils.exceptions import ExistingEmail, ExistingUsername
 from check_in.models import CheckIn
 from note.models import Note
-from notification.models import Notification
 from ping.models import get_ping_room, get_or_create_ping_room
 from qna.models import Response
 
@@ -37,20 +37,15 @@ class CurrentUserSerializer(CountryFieldMixin, serializers.HyperlinkedModelSeria
         return settings.BASE_URL + reverse('user-detail', kwargs={'username': obj.username})
 
     def get_unread_noti(self, obj):
-        notifications = Notification.objects.visible_only().filter(user=obj, is_read=False)
+        return obj.unread_noti_cnt > 0
 
-        if obj.ver_changed_at:
-            notifications = notifications.filter(created_at__gte=obj.ver_changed_at)
-
-        return notifications.exists()
-    
     def get_unread_noti_cnt(self, obj):
-        notifications = Notification.objects.visible_only().filter(user=obj, is_read=False)
+        return obj.unread_noti_cnt
 
-        if obj.ver_changed_at:
-            notifications = notifications.filter(created_at__gte=obj.ver_changed_at)
-
-        return notifications.count()
+    def validate_timezone(self, value):
+        if value not in available_timezones():
+            raise serializers.ValidationError(f"Invalid timezone: {value}")
+        return value
 
     def validate_noti_period_days(self, value):
         if not isinstance(value, list):
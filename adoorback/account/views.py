@@ -654,14 +654,16 @@ class CurrentUserDetail(generics.RetrieveUpdateAPIView):
                 self.request.user.friendship_originated_notis.filter(
                     target_type=friend_request_ct
                 ).update(
-                    redirect_url=f"/users/{new_username}"
+                    redirect_url=f"/users/{new_username}",
+                    updated_at=timezone.now()
                 )
                 
                 # "became friends" notification
                 Notification = apps.get_model('notification', 'Notification')
                 notis_to_change = Notification.objects.filter(redirect_url=f'/users/{old_username}')
                 notis_to_change.update(
-                    redirect_url=f"/users/{new_username}"
+                    redirect_url=f"/users/{new_username}",
+                    updated_at=timezone.now()
                 )
 
 
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import statistics
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from chat.models import ChatRoom, Message
+from chat.routing import websocket_urlpatterns
+
+
+DEFAULT_BASELINE = os.path.join(settings.BASE_DIR, 'test', 'chat_bench_baseline.json')
+
+# metrics compared against the stored baseline (lower is better)
+BASELINE_METRICS = ('queries_per_message', 'queries_per_like', 'queries_per_connect')
+
+# time given to consumers to finish the handler work that follows their last frame
+SETTLE_SECONDS = 0.2
+FRAME_TIMEOUT = 10
+
+User = get_user_model()
+
+
+class QueryCounter:
+    """
+    Counts queries on every database connection, including the ones opened by consumer threads.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, sender=None, connection=None, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark chat sockets (send, like and read flows) against a throwaway test database ' \
+           'and fail if queries per operation regress past the stored baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=10, help='Number of chat rooms.')
+        parser.add_argument('--users', type=int, default=5, help='Members per chat room.')
+        parser.add_argument('--messages', type=int, default=20, help='Messages sent per chat room.')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline json file.')
+        parser.add_argument('--tolerance', type=float, default=0.1,
+                            help='Allowed relative regression of query counts over the baseline.')
+        parser.add_argument('--update-baseline', action='store_true', help='Store this run as the new baseline.')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('A chat room needs at least 2 users.')
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        try:
+            with override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+                rooms = self.seed(options['rooms'], options['users'])
+                counter.install(connection=connection)
+                results = asyncio.run(self.run_flows(rooms, options['messages'], counter))
+        finally:
+            connection_created.disconnect(counter.install)
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        self.report(results)
+        self.compare_baseline(results, options)
+
+    def seed(self, room_cnt, user_cnt):
+        run_id = int(time.time())
+        rooms = []
+        for i in range(room_cnt):
+            users = [User.objects.create_user(username=f'bench_{run_id}_{i}_{j}',
+                                              email=f'bench_{run_id}_{i}_{j}@example.com')
+                     for j in range(user_cnt)]
+            chat_room = ChatRoom.objects.create()
+            chat_room.users.add(*users)
+            rooms.append((chat_room.id, users))
+        return rooms
+
+    async def run_flows(self, rooms, message_cnt, counter):
+        application = URLRouter(websocket_urlpatterns)
+        sockets = {}
+        for room_id, users in rooms:
+            for user in users:
+                communicator = WebsocketCommunicator(application, f'/ws/chat/{room_id}/')
+                communicator.scope['user'] = user
+                sockets[room_id, user.id] = communicator
+
+        # connect (each connect also marks the room as read)
+        start_queries = counter.count
+        for communicator in sockets.values():
+            connected, _ = await communicator.connect(timeout=FRAME_TIMEOUT)
+            if not connected:
+                raise CommandError('Chat socket was rejected.')
+        await asyncio.sleep(SETTLE_SECONDS)
+        connect_queries = counter.count - start_queries
+        for communicator in sockets.values():
+            await self.drain(communicator)
+
+        # send: rooms run concurrently, messages within a room one at a time
+        latencies = []
+        start_queries, start_time = counter.count, time.perf_counter()
+        await asyncio.gather(*[self.send_messages(room_id, users, sockets, message_cnt, latencies)
+                               for room_id, users in rooms])
+        send_seconds = time.perf_counter() - start_time
+        await asyncio.sleep(SETTLE_SECONDS)
+        message_queries = counter.count - start_queries
+
+        # like: every member likes the last message of its room
+        last_message_ids = await sync_to_async(self.last_message_ids)([room_id for room_id, _ in rooms])
+        start_queries = counter.count
+        await asyncio.gather(*[self.like_message(room_id, users, sockets, last_message_ids[room_id])
+                               for room_id, users in rooms])
+        await asyncio.sleep(SETTLE_SECONDS)
+        like_queries = counter.count - start_queries
+
+        # read: buffered read status is flushed on disconnect
+        start_queries = counter.count
+        for communicator in sockets.values():
+            await communicator.disconnect()
+        read_queries = counter.count - start_queries
+
+        sent_cnt = len(rooms) * message_cnt
+        like_cnt = sum(len(users) for _, users in rooms)
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'sockets': len(sockets),
+            'messages': sent_cnt,
+            'messages_per_second': round(sent_cnt / send_seconds, 2),
+            'fan_out_p50_ms': round(quantiles[49] * 1000, 2),
+            'fan_out_p99_ms': round(quantiles[98] * 1000, 2),
+            'queries_per_connect': round(connect_queries / len(sockets), 2),
+            'queries_per_message': round(message_queries / sent_cnt, 2),
+            'queries_per_like': round(like_queries / like_cnt, 2),
+            'queries_per_disconnect': round(read_queries / len(sockets), 2),
+        }
+
+    async def send_messages(self, room_id, users, sockets, message_cnt, latencies):
+        for i in range(message_cnt):
+            sender = users[i % len(users)]
+            content = f'bench {room_id} {i}'
+            sent_at = time.perf_counter()
+            await sockets[room_id, sender.id].send_json_to({
+                'action': 'message',
+                'content': content,
+                'userId': sender.id,
+                'userName': sender.username,
+                'parentId': None,
+            })
+            arrivals = await asyncio.gather(*[self.wait_for_frame(sockets[room_id, user.id], 'content', content)
+                                              for user in users])
+            latencies.extend(arrived_at - sent_at for arrived_at in arrivals)
+
+    async def like_message(self, room_id, users, sockets, message_id):
+        for user in users:
+            await sockets[room_id, user.id].send_json_to({'action': 'like', 'messageId': message_id})
+            await asyncio.gather(*[self.wait_for_frame(sockets[room_id, member.id], 'action', 'like')
+                                   for member in users])
+
+    async def wait_for_frame(self, communicator, key, value):
+        while True:
+            frame = await communicator.receive_json_from(timeout=FRAME_TIMEOUT)
+            if frame.get(key) == value:
+                return time.perf_counter()
+
+    async def drain(self, communicator):
+        while not await communicator.receive_nothing(timeout=0.01):
+            await communicator.receive_output()
+
+    @staticmethod
+    def last_message_ids(room_ids):
+        return {room_id: Message.objects.filter(chat_room_id=room_id).latest('id').id for room_id in room_ids}
+
+    def report(self, results):
+        for name, value in results.items():
+            self.stdout.write(f'{name}: {value}')
+
+    def compare_baseline(self, results, options):
+        path = options['baseline']
+        if options['update_baseline']:
+            with open(path, 'w') as f:
+                json.dump({name: results[name] for name in BASELINE_METRICS}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Baseline stored in {path}.'))
+            return
+
+        if not os.path.exists(path):
+            # a gate without a baseline would pass anything
+            raise CommandError(f'No baseline at {path}; run with --update-baseline to store one.')
+
+        with open(path) as f:
+            baseline = json.load(f)
+        regressions = [f'{name}: {results[name]} > {baseline[name]}'
+                       for name in BASELINE_METRICS
+                       if name in baseline and results[name] > baseline[name] * (1 + options['tolerance'])]
+        if regressions:
+            raise CommandError('Query count regressed past the baseline: ' + ', '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Query counts are within the baseline.'))
@@ -0,0 +1,52 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from safedelete.models import HARD_DELETE
+
+from notification.models import Notification, NOTIFICATION_RETENTION_DAYS
+
+
+PRUNE_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Hard delete read or soft deleted notifications older than the retention period, in bounded batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=NOTIFICATION_RETENTION_DAYS,
+                            help='Keep notifications created within this many days.')
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE, help='Notifications per delete.')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to wait between batches.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the notifications to delete.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Pruning notifications created before {cutoff}...'))
+
+        # unread notifications are kept so that nothing disappears before the user has seen it
+        # (deleting only read / deleted ones also leaves the unread counters untouched);
+        # rows changed within the period are kept too, so NotificationDelta still reports them
+        prunable = Notification.all_objects.filter(created_at__lt=cutoff, updated_at__lt=cutoff) \
+            .filter(Q(is_read=True) | Q(deleted__isnull=False)).order_by('id')
+
+        if options['dry_run']:
+            self.stdout.write(f'{prunable.count()} notification(s) would be deleted.')
+            return
+
+        # walk forward by id so that kept (unread) rows are not scanned again for every batch
+        last_id, count = 0, 0
+        while True:
+            ids = list(prunable.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            # actors and queued pushes are deleted along with their notifications
+            Notification.all_objects.filter(id__in=ids).delete(force_policy=HARD_DELETE)
+            last_id, count = ids[-1], count + len(ids)
+            self.stdout.write(f'{count} notification(s) deleted...')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'{count} notification(s) deleted.'))
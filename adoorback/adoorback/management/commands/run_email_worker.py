@@ -0,0 +1,35 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from adoorback.utils.alerts import send_msg_to_slack
+from task.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails (see task/mail.py) until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Send one batch and exit.')
+        parser.add_argument('--sleep', type=float, default=5.0, help='Seconds to wait when no email is due.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting email worker...'))
+
+        while True:
+            close_old_connections()
+            try:
+                handled = send_queued_emails()
+            except Exception as e:
+                stack_trace = traceback.format_exc()
+                send_msg_to_slack(text=f"🚨 Email worker failed: {e}\n```{stack_trace}```", level="ERROR")
+                print(f"🚨 Email worker failed: {e}\n```{stack_trace}```")
+                handled = 0
+
+            if options['once']:
+                self.stdout.write(f'{handled} email(s) handled.')
+                return
+            if not handled:
+                time.sleep(options['sleep'])
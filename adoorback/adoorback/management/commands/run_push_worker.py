@@ -0,0 +1,35 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from adoorback.utils.alerts import send_msg_to_slack
+from notification.push import drain_push_outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued firebase pushes (notification outbox) until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain one batch and exit.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the outbox is empty.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting push worker...'))
+
+        while True:
+            close_old_connections()
+            try:
+                handled = drain_push_outbox()
+            except Exception as e:
+                stack_trace = traceback.format_exc()
+                send_msg_to_slack(text=f"🚨 Push worker failed: {e}\n```{stack_trace}```", level="ERROR")
+                print(f"🚨 Push worker failed: {e}\n```{stack_trace}```")
+                handled = 0
+
+            if options['once']:
+                self.stdout.write(f'{handled} push(es) handled.')
+                return
+            if not handled:
+                time.sleep(options['sleep'])
@@ -0,0 +1,42 @@
+import time
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django_cron import CronJobManager, get_class
+from django_cron.management.commands.runcrons import clear_old_log_entries
+
+from adoorback.utils.alerts import send_msg_to_slack
+
+
+class Command(BaseCommand):
+    help = 'Run the CRON_CLASSES jobs on their own schedules in one long-running process (runs are logged in CronJobLog).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run the due jobs once and exit.')
+        parser.add_argument('--sleep', type=float, default=30.0, help='Seconds between schedule checks.')
+
+    def handle(self, *args, **options):
+        # jobs without a schedule of their own (run_every_mins=0) are only run by hand with runcrons --force
+        cron_classes = [cron_class for cron_class in map(get_class, settings.CRON_CLASSES)
+                        if cron_class.schedule.run_every_mins or cron_class.schedule.run_at_times]
+        self.stdout.write(self.style.SUCCESS(
+            f'Starting scheduler for {", ".join(cron_class.code for cron_class in cron_classes)}...'))
+
+        while True:
+            close_old_connections()
+            try:
+                for cron_class in cron_classes:
+                    # checks the schedule against CronJobLog, takes the job's lock, runs and logs it
+                    with CronJobManager(cron_class, silent=True) as manager:
+                        manager.run()
+                clear_old_log_entries()
+            except Exception as e:
+                stack_trace = traceback.format_exc()
+                send_msg_to_slack(text=f"🚨 Scheduler failed: {e}\n```{stack_trace}```", level="ERROR")
+                print(f"🚨 Scheduler failed: {e}\n```{stack_trace}```")
+
+            if options['once']:
+                return
+            time.sleep(options['sleep'])
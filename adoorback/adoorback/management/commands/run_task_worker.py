@@ -0,0 +1,35 @@
+import time
+import traceback
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from adoorback.utils.alerts import send_msg_to_slack
+from task.queue import run_due_tasks
+
+
+class Command(BaseCommand):
+    help = 'Run queued tasks (see task/queue.py) until stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run one batch and exit.')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when no task is due.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Starting task worker...'))
+
+        while True:
+            close_old_connections()
+            try:
+                handled = run_due_tasks()
+            except Exception as e:
+                stack_trace = traceback.format_exc()
+                send_msg_to_slack(text=f"🚨 Task worker failed: {e}\n```{stack_trace}```", level="ERROR")
+                print(f"🚨 Task worker failed: {e}\n```{stack_trace}```")
+                handled = 0
+
+            if options['once']:
+                self.stdout.write(f'{handled} task(s) handled.')
+                return
+            if not handled:
+                time.sleep(options['sleep'])
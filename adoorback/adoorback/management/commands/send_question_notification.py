@@ -4,7 +4,7 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 from account.models import User
-from notification.models import Notification, NotificationActor
+from notification.models import Notification
 
 
 class Command(BaseCommand):
@@ -19,11 +19,8 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR('❌ Admin user not found!'))
             return
 
-        users = User.objects.all()
-        count = 0
-
-        for user in users:
-            noti = Notification.objects.create(
+        notifications = [
+            Notification(
                 user=user,
                 target=admin,
                 origin=admin,
@@ -31,7 +28,8 @@ class Command(BaseCommand):
                 message_en="[📣 Research Team] Please help us understand what you’re hoping to get out of the Q&A feature 🚀🚀",
                 redirect_url='/suggest-questions'
             )
-            NotificationActor.objects.create(user=admin, notification=noti)
-            count += 1
+            for user in User.objects.only('id')
+        ]
+        Notification.objects.bulk_create_notifications(admin, notifications)
 
-        self.stdout.write(self.style.SUCCESS(f'✅ {count} notifications successfully sent!'))
+        self.stdout.write(self.style.SUCCESS(f'✅ {len(notifications)} notifications successfully sent!'))
@@ -7,6 +7,7 @@ from django.db.models import Q
 from django.utils.timezone import now
 
 from account.models import User
+from notification.models import refresh_unread_noti_cnt
 
 
 class Command(BaseCommand):
@@ -98,4 +99,7 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Group 4 update complete: {updated_cnt} users')
 
+        # unread notification counts only cover notifications since ver_changed_at
+        refresh_unread_noti_cnt(users.values_list('id', flat=True))
+
         self.stdout.write(self.style.SUCCESS('All updates successfully completed!'))
@@ -14,6 +14,7 @@ from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import UntypedToken
 from urllib.parse import parse_qs
 
+from account.cache import get_jwt_user, set_jwt_user
 from custom_fcm.models import CustomFCMDevice
 
 User = get_user_model()
@@ -21,10 +22,19 @@ User = get_user_model()
 
 @database_sync_to_async
 def get_user(validated_token):
+    # clients open several sockets at once with the same token, so reuse a short-lived snapshot
+    user_id = validated_token["user_id"]
+    issued_at = validated_token.get("iat")
+    user = get_jwt_user(user_id, issued_at)
+    if user is not None:
+        return user
+
     try:
-        return User.objects.get(id=validated_token["user_id"])
+        user = User.objects.get(id=user_id)
     except User.DoesNotExist:
         return AnonymousUser()
+    set_jwt_user(user, issued_at)
+    return user
 
 
 class JwtAuthMiddleware(BaseMiddleware):
@@ -81,6 +81,7 @@ INSTALLED_APPS = [
     'user_report.apps.UserReportConfig',
     'translate.apps.TranslateConfig',
     'ping.apps.PingConfig',
+    'task.apps.TaskConfig',
     'custom_fcm',
     'modeltranslation',
     'django.contrib.admin',
@@ -112,8 +113,16 @@ CRON_CLASSES = [
     "account.cron.SendDailyWhoAmINotiCronJob",
     "account.cron.AutoCloseSessionsCronJob",
     "account.cron.SendDailySurveyNotiCronJob",
+    "notification.cron.ReconcileUnreadNotiCntCronJob",
+    "notification.cron.PruneNotificationsCronJob",
 ]
 
+# run deferred tasks right away instead of through the task worker (for tests)
+TASKS_EAGER = False
+
+# run by the resident `run_scheduler` command; the advisory lock keeps a job from overlapping with itself
+DJANGO_CRON_LOCK_BACKEND = 'adoorback.utils.locks.AdvisoryLock'
+
 # reference: https://github.com/jazzband/django-redis
 # CACHES = {
 #     "default": {
@@ -233,6 +242,8 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_HOST_USER = 'whoami.today.official@gmail.com'
 EMAIL_HOST_PASSWORD = os.environ['EMAIL_HOST_PASSWORD']
 SERVER_EMAIL = 'whoami.today.official@gmail.com'
+# seconds before a hung SMTP connection fails (and is retried) instead of blocking the email worker
+EMAIL_TIMEOUT = 10
 
 # https://fcm-django.readthedocs.io/en/latest/
 FIREBASE_CREDENTIAL_PATH = os.path.join(BASE_DIR, 'serviceAccountKey.json')
@@ -0,0 +1,24 @@
+import zlib
+
+from django.db import connection
+from django_cron.backends.lock.base import DjangoCronJobLock
+
+
+class AdvisoryLock(DjangoCronJobLock):
+    """
+    django_cron lock backend on postgres session advisory locks, so that a job never runs twice at the same time
+    across processes (the scheduler, a manual runcrons, ...). Locks are released with the connection if a process dies.
+    """
+
+    def __init__(self, cron_class, silent, *args, **kwargs):
+        super().__init__(cron_class, silent, *args, **kwargs)
+        self.key = zlib.crc32(self.job_name.encode())
+
+    def lock(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [self.key])
+            return cursor.fetchone()[0]
+
+    def release(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_unlock(%s)', [self.key])
@@ -0,0 +1,23 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """
+    Keyset pagination on `ordering` for clients that ask for it with ?pagination=cursor
+    (the next / previous links keep asking through their `cursor` parameter).
+    Every other request keeps the page-number pagination released app versions expect, with `count`.
+    """
+
+    def use_cursor(self, request):
+        return request.query_params.get('pagination') == 'cursor' or self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.use_cursor(request):
+            self.page_number_pagination = PageNumberPagination()
+            return self.page_number_pagination.paginate_queryset(queryset.order_by(*self.ordering), request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if hasattr(self, 'page_number_pagination'):
+            return self.page_number_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,62 @@
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+
+
+ROOM_MEMBERS_KEY = 'chat.room_members:{room_id}'
+ONE_ON_ONE_ROOMS_KEY = 'chat.one_on_one_rooms:{user_id}'
+
+# signals invalidate entries eagerly; the timeout only bounds staleness in other processes
+CACHE_TIMEOUT = 60 * 5
+
+
+def _room_user_model():
+    return apps.get_model('chat', 'ChatRoom').users.through
+
+
+def get_room_member_ids(room_id):
+    key = ROOM_MEMBERS_KEY.format(room_id=room_id)
+    member_ids = cache.get(key)
+    if member_ids is None:
+        member_ids = set(_room_user_model().objects.filter(chatroom_id=room_id).values_list('user_id', flat=True))
+        cache.set(key, member_ids, CACHE_TIMEOUT)
+    return member_ids
+
+
+def is_room_member(room_id, user_id):
+    return user_id in get_room_member_ids(room_id)
+
+
+def get_one_on_one_room_ids(user_id):
+    """
+    Return {friend_id: chat_room_id} for the active 1:1 chat rooms of user.
+    """
+    key = ONE_ON_ONE_ROOMS_KEY.format(user_id=user_id)
+    room_ids = cache.get(key)
+    if room_ids is None:
+        room_members = {}
+        for room_id, member_id in _room_user_model().objects.filter(
+                chatroom__users=user_id,
+                chatroom__active=True,
+                chatroom__deleted__isnull=True,
+        ).values_list('chatroom_id', 'user_id'):
+            room_members.setdefault(room_id, []).append(member_id)
+
+        room_ids = {}
+        for room_id in sorted(room_members):  # the most recent room wins
+            members = room_members[room_id]
+            if len(members) == 2:
+                friend_id = members[0] if members[1] == user_id else members[1]
+                room_ids[friend_id] = room_id
+        cache.set(key, room_ids, CACHE_TIMEOUT)
+    return room_ids
+
+
+def invalidate_chat_rooms(room_ids=(), user_ids=()):
+    keys = [ROOM_MEMBERS_KEY.format(room_id=room_id) for room_id in room_ids] + \
+           [ONE_ON_ONE_ROOMS_KEY.format(user_id=user_id) for user_id in user_ids]
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # drop again after commit in case a concurrent request cached pre-commit state in the meantime
+    transaction.on_commit(lambda: cache.delete_many(keys))
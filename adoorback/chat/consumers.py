@@ -1,5 +1,4 @@
 from datetime import datetime
-import json
 
 from asgiref.sync import async_to_sync
 from channels.exceptions import DenyConnection
@@ -8,8 +7,12 @@ from django.contrib.auth import get_user_model
 from django.core.exceptions import PermissionDenied, ValidationError
 from safedelete.models import HARD_DELETE
 
+from chat import presence
+from chat.cache import is_room_member
+from chat.framing import FramingMixin
 from chat.models import Message, ChatRoom, MessageLike
-from utils.helpers import update_last_read_message
+from chat.topics import USER_TOPICS, room_topic, parse_room_topic, room_group, user_group
+from utils.helpers import buffer_last_read_message, flush_last_read_messages, update_last_read_message
 
 
 TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.000+00:00"
@@ -20,87 +23,131 @@ from utils.helpers import update_last_read_message
 
 User = get_user_model()
 
+# fields forwarded to the client for each per-user topic
+USER_TOPIC_FIELDS = {
+    presence.CHAT_LIST: ("content", "roomId", "timestamp", "unreadCnt"),
+    presence.FRIEND_LIST: ("friendId", "unreadCnt"),
+    presence.CHAT_ICON: ("unreadCnt",),
+    presence.NOTIFICATION: ("notificationId", "messageKo", "messageEn", "redirectUrl", "updatedAt", "deltaCursor",
+                                 "unreadNotiCnt"),
+}
 
-class ChatConsumer(WebsocketConsumer):
-    def connect(self):
-        user = self.scope["user"]
-        self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
-        self.room_group_id = f"chat_{self.room_id}"
 
-        chat_room = ChatRoom.objects.get(id=self.room_id)
-        if user not in chat_room.users.all():
-            raise DenyConnection("You must be a member to join this chat.")
+class PresenceMixin:
+    presence_kind = None
+
+    def register_presence(self, kind=None):
+        kind = kind or self.presence_kind
+        if not hasattr(self, 'presence_kinds'):
+            self.presence_kinds = set()
+        self.presence_kinds.add(kind)
+        presence.socket_connected(self.scope["user"].id, kind, self.channel_name)
+
+    def unregister_presence(self, kind=None):
+        kind = kind or self.presence_kind
+        getattr(self, 'presence_kinds', set()).discard(kind)
+        presence.socket_disconnected(self.scope["user"].id, kind, self.channel_name)
+
+
+class ChatRoomMixin(PresenceMixin):
+    """
+    Chat room behaviour shared by ChatConsumer (one room per socket)
+    and RealtimeConsumer (any number of rooms, subscribed as `chat:<room_id>` topics).
+    """
+
+    def send_frame(self, topic, payload):
+        self.send_payload(payload)
+
+    def join_room(self, room_id):
+        user = self.scope["user"]
+        if not is_room_member(room_id, user.id):
+            return False
 
         # Join room group
         async_to_sync(self.channel_layer.group_add)(
-            self.room_group_id, self.channel_name
+            room_group(room_id), self.channel_name
         )
-
-        self.accept()
+        self.rooms[room_topic(room_id)] = room_id
+        self.register_presence(presence.CHAT)
 
         # Update last read message for user
-        user = self.scope["user"]
-        chat_room = ChatRoom.objects.get(id=self.room_id)
+        chat_room = ChatRoom.objects.get(id=room_id)
         update_last_read_message(user, chat_room)
 
-        # Send message to own chat_list group 
+        # Send message to own chat_list group
         # (in case of accessing chatroom, chat list in different devices)
-        if chat_room.messages.all():
+        if presence.has_sockets(user.id, presence.CHAT_LIST) and chat_room.messages.all():
             async_to_sync(self.channel_layer.group_send)(
-                f"user_{user.id}_chat_list", {
+                user_group(user.id, presence.CHAT_LIST), {
                     "type": "chat.message",
-                    "roomId": self.room_id,
+                    "topic": presence.CHAT_LIST,
+                    "roomId": room_id,
                     "content": chat_room.last_message_content,
                     "timestamp": chat_room.last_message_time.strftime(TIME_FORMAT),
                     "unreadCnt": 0
                 }
             )
 
-        # Send message to own friend_list group 
+        # Send message to own friend_list group
         # (in case of accessing chatroom, friend list in different devices)
-        if chat_room.messages.all() and chat_room.users.count() == 2:
+        if presence.has_sockets(user.id, presence.FRIEND_LIST) and \
+                chat_room.messages.all() and chat_room.users.count() == 2:
             friend_id = chat_room.users.exclude(id=user.id).first().id
             async_to_sync(self.channel_layer.group_send)(
-                f"user_{user.id}_friend_list", {
+                user_group(user.id, presence.FRIEND_LIST), {
                     "type": "chat.message",
+                    "topic": presence.FRIEND_LIST,
                     "friendId": friend_id,
                     "unreadCnt": 0
                 }
             )
 
-        # Send message to own chat_icon group 
+        # Send message to own chat_icon group
         # (in case of accessing chatroom, app in different devices)
-        if chat_room.messages.all():
+        if presence.has_sockets(user.id, presence.CHAT_ICON) and chat_room.messages.all():
             updated_cnt = user.unread_message_cnt
             async_to_sync(self.channel_layer.group_send)(
-                f"user_{user.id}_chat_icon", {
+                user_group(user.id, presence.CHAT_ICON), {
                     "type": "chat.message",
+                    "topic": presence.CHAT_ICON,
                     "unreadCnt": updated_cnt
                 }
             )
+        return True
 
-    def disconnect(self, close_code):
+    def leave_room(self, room_id):
         # Leave room group
         async_to_sync(self.channel_layer.group_discard)(
-            self.room_group_id, self.channel_name
+            room_group(room_id), self.channel_name
         )
+        self.rooms.pop(room_topic(room_id), None)
+        if not self.rooms:
+            self.unregister_presence(presence.CHAT)
+
+        # Write buffered read status before the user leaves the room
+        flush_last_read_messages()
 
     # Receive message from WebSocket
-    def receive(self, text_data):
-        text_data_json = json.loads(text_data)
+    def receive_room_action(self, room_id, text_data_json):
+        topic = room_topic(room_id)
 
         if text_data_json.get('action') == 'like':
             user_id = self.scope["user"].id
             message_id = text_data_json["messageId"]
 
             # Save like to database
-            MessageLike.objects.create(user_id=user_id, message_id=message_id)
+            message_like = MessageLike.objects.create(user_id=user_id, message_id=message_id)
+            message_like_cnt = MessageLike.objects.filter(message_id=message_id).count()
 
             # Send like to room group
             async_to_sync(self.channel_layer.group_send)(
-                self.room_group_id, {
+                room_group(room_id), {
                     "type": "chat.like",
+                    "topic": topic,
                     "messageId": message_id,
+                    "messageLikeCnt": message_like_cnt,
+                    "userId": user_id,
+                    "messageLikeId": message_like.id,
                 }
             )
 
@@ -114,12 +161,17 @@ class ChatConsumer(WebsocketConsumer):
                 raise PermissionDenied("You can only remove likes that you created.")
             message_id = message_like.message_id
             message_like.delete(force_policy=HARD_DELETE)
+            message_like_cnt = MessageLike.objects.filter(message_id=message_id).count()
 
             # Send like remove to room group
             async_to_sync(self.channel_layer.group_send)(
-                self.room_group_id, {
+                room_group(room_id), {
                     "type": "chat.like",
+                    "topic": topic,
                     "messageId": message_id,
+                    "messageLikeCnt": message_like_cnt,
+                    "userId": user_id,
+                    "messageLikeId": None,
                 }
             )
 
@@ -142,9 +194,9 @@ class ChatConsumer(WebsocketConsumer):
 
             # Save message to database
             new_message = Message.objects.create(
-                sender_id=user_id, 
-                content=content, 
-                chat_room_id=self.room_id, 
+                sender_id=user_id,
+                content=content,
+                chat_room_id=room_id,
                 timestamp=timestamp,
                 parent=parent
             )
@@ -152,11 +204,12 @@ class ChatConsumer(WebsocketConsumer):
 
             # Send message to room group
             async_to_sync(self.channel_layer.group_send)(
-                self.room_group_id, {
-                    "type": "chat.message", 
-                    "content": content, 
+                room_group(room_id), {
+                    "type": "chat.message",
+                    "topic": topic,
+                    "content": content,
                     "messageId": message_id,
-                    "userName": user_name, 
+                    "userName": user_name,
                     "timestamp": timestamp_str,
                     "parentId": parent_id,
                     "parentContent": parent_content
@@ -164,39 +217,50 @@ class ChatConsumer(WebsocketConsumer):
             )
 
             # Send message to chat_list, chat_icon group
-            chat_room = ChatRoom.objects.get(id=self.room_id)
+            # (skipping recipients without such a socket open, along with their unread count queries)
+            chat_room = ChatRoom.objects.get(id=room_id)
             recipients = chat_room.users.exclude(id=user_id)
             for r in recipients:
-                async_to_sync(self.channel_layer.group_send)(
-                    f"user_{r.id}_chat_list", {
-                        "type": "chat.message",
-                        "roomId": self.room_id,
-                        "content": content,
-                        "timestamp": timestamp_str,
-                        "unreadCnt": chat_room.unread_cnt(r)
-                    }
-                )
-                updated_cnt = r.unread_message_cnt
-                async_to_sync(self.channel_layer.group_send)(
-                    f"user_{r.id}_chat_icon", {
-                        "type": "chat.message",
-                        "unreadCnt": updated_cnt
-                    }
-                )
+                if presence.has_sockets(r.id, presence.CHAT_LIST):
+                    async_to_sync(self.channel_layer.group_send)(
+                        user_group(r.id, presence.CHAT_LIST), {
+                            "type": "chat.message",
+                            "topic": presence.CHAT_LIST,
+                            "roomId": room_id,
+                            "content": content,
+                            "timestamp": timestamp_str,
+                            "unreadCnt": chat_room.unread_cnt(r)
+                        }
+                    )
+                if presence.has_sockets(r.id, presence.CHAT_ICON):
+                    updated_cnt = r.unread_message_cnt
+                    async_to_sync(self.channel_layer.group_send)(
+                        user_group(r.id, presence.CHAT_ICON), {
+                            "type": "chat.message",
+                            "topic": presence.CHAT_ICON,
+                            "unreadCnt": updated_cnt
+                        }
+                    )
 
             # Send message to friend_list group
             if chat_room.users.count() == 2:
                 friend_id = recipients.first().id
-                async_to_sync(self.channel_layer.group_send)(
-                    f"user_{friend_id}_friend_list", {
-                        "type": "chat.message",
-                        "friendId": user_id,
-                        "unreadCnt": chat_room.unread_cnt(r)
-                    }
-                )
+                if presence.has_sockets(friend_id, presence.FRIEND_LIST):
+                    async_to_sync(self.channel_layer.group_send)(
+                        user_group(friend_id, presence.FRIEND_LIST), {
+                            "type": "chat.message",
+                            "topic": presence.FRIEND_LIST,
+                            "friendId": user_id,
+                            "unreadCnt": chat_room.unread_cnt(r)
+                        }
+                    )
 
     # Receive message from room group
-    def chat_message(self, event):
+    def room_message(self, event):
+        room_id = self.rooms.get(event["topic"])
+        if room_id is None:  # left the room while the event was in flight
+            return
+
         content = event["content"]
         user_name = event["userName"]
         timestamp = event["timestamp"]
@@ -204,40 +268,44 @@ class ChatConsumer(WebsocketConsumer):
         parent_content = event["parentContent"]
 
         # Send message to WebSocket
-        self.send(text_data=json.dumps({
-            "content": content, 
-            "userName": user_name, 
+        self.send_frame(event["topic"], {
+            "content": content,
+            "userName": user_name,
             "timestamp": timestamp,
             "parentId": parent_id,
             "parentContent": parent_content
-        }))
+        })
 
         # Save read status to database
+        # (coalesced per user and room, so busy rooms write once per flush interval instead of per message)
         user = self.scope["user"]
-        chat_room = ChatRoom.objects.get(id=self.room_id)
+        chat_room = ChatRoom.objects.get(id=room_id)
         if user.username != user_name:
-            update_last_read_message(user, chat_room)
+            buffer_last_read_message(user.id, room_id, event["messageId"])
 
-        # Send message to own chat_list group 
+        # Send message to own chat_list group
         # (in case of accessing chatroom, chat list in different devices)
         if chat_room.messages.all():
             async_to_sync(self.channel_layer.group_send)(
-                f"user_{user.id}_chat_list", {
+                user_group(user.id, presence.CHAT_LIST), {
                     "type": "chat.message",
-                    "roomId": self.room_id,
+                    "topic": presence.CHAT_LIST,
+                    "roomId": room_id,
                     "content": chat_room.last_message_content,
                     "timestamp": chat_room.last_message_time.strftime(TIME_FORMAT),
                     "unreadCnt": 0
                 }
             )
 
-        # Send message to own friend_list group 
+        # Send message to own friend_list group
         # (in case of accessing chatroom, friend list in different devices)
-        if chat_room.messages.all() and chat_room.users.count() == 2:
+        if presence.has_sockets(user.id, presence.FRIEND_LIST) and \
+                chat_room.messages.all() and chat_room.users.count() == 2:
             friend_id = chat_room.users.exclude(id=user.id).first().id
             async_to_sync(self.channel_layer.group_send)(
-                f"user_{user.id}_friend_list", {
+                user_group(user.id, presence.FRIEND_LIST), {
                     "type": "chat.message",
+                    "topic": presence.FRIEND_LIST,
                     "friendId": friend_id,
                     "unreadCnt": 0
                 }
@@ -245,49 +313,169 @@ class ChatConsumer(WebsocketConsumer):
 
     # Receive like change from room group
     def chat_like(self, event):
+        if event["topic"] not in self.rooms:
+            return
         message_id = event["messageId"]
+        message_like_cnt = event["messageLikeCnt"]
 
-        message_like_cnt = Message.objects.get(id=message_id).message_likes.count()
+        # the like count is computed once by the sender; only the viewer's own like needs a lookup
         user = self.scope["user"]
-        current_user_message_like = MessageLike.objects.filter(user_id=user.id, message_id=message_id)
-        current_user_message_like_id = current_user_message_like[0].id if current_user_message_like else None
+        if event["userId"] == user.id:
+            current_user_message_like_id = event["messageLikeId"]
+        else:
+            current_user_message_like = MessageLike.objects.filter(user_id=user.id, message_id=message_id)
+            current_user_message_like_id = current_user_message_like[0].id if current_user_message_like else None
 
         # Send like change to WebSocket
-        self.send(text_data=json.dumps({
+        self.send_frame(event["topic"], {
             "action": "like",
             "messageId": message_id,
             "messageLikeCnt": message_like_cnt,
             "currentUserMessageLikeId": current_user_message_like_id
-        }))
+        })
+
+    # Receive read receipt change from room group
+    # (messages in (fromMessageId, toMessageId] gained one reader)
+    def chat_read(self, event):
+        if event["topic"] not in self.rooms:
+            return
+        self.send_frame(event["topic"], {
+            "action": "read",
+            "userId": event["userId"],
+            "fromMessageId": event["fromMessageId"],
+            "toMessageId": event["toMessageId"],
+        })
 
-        # Send message to own chat_icon group 
-        # (in case of accessing chatroom, app in different devices)
-        if chat_room.messages.all():
-            updated_cnt = user.unread_message_cnt
-            async_to_sync(self.channel_layer.group_send)(
-                f"user_{user.id}_chat_icon", {
-                    "type": "chat.message",
-                    "unreadCnt": updated_cnt
-                }
-            )
 
+class ChatConsumer(FramingMixin, ChatRoomMixin, WebsocketConsumer):
+    presence_kind = presence.CHAT
+
+    def connect(self):
+        self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
+        self.rooms = {}
+
+        if not self.join_room(self.room_id):
+            raise DenyConnection("You must be a member to join this chat.")
+
+        self.accept()
+
+    def disconnect(self, close_code):
+        if self.room_id in self.rooms.values():
+            self.leave_room(self.room_id)
+
+    # Receive message from WebSocket
+    def receive(self, text_data=None, bytes_data=None):
+        self.receive_room_action(self.room_id, self.load_payload(text_data, bytes_data))
+
+    # Receive message from room group
+    def chat_message(self, event):
+        self.room_message(event)
+
+
+class RealtimeConsumer(FramingMixin, ChatRoomMixin, WebsocketConsumer):
+    """
+    A single socket per user that multiplexes chat rooms and the per-user topics.
+    Clients send {"action": "subscribe" | "unsubscribe", "topic": ...} frames, where topic is
+    `chat_list`, `friend_list`, `chat_icon`, `notification` or `chat:<room_id>`;
+    room actions (message, like, remove_like) carry the room topic.
+    Every frame sent to the client carries the topic it belongs to.
+    """
+
+    def connect(self):
+        if not self.scope["user"].is_authenticated:
+            raise DenyConnection("Authentication credentials were not provided.")
+        self.rooms = {}
+        self.user_topics = set()
+        self.accept()
+
+    def disconnect(self, close_code):
+        for room_id in list(self.rooms.values()):
+            self.leave_room(room_id)
+        for topic in list(self.user_topics):
+            self.unsubscribe_user_topic(topic)
+
+    def send_frame(self, topic, payload):
+        self.send_payload({"topic": topic, **payload})
+
+    def send_error(self, topic, detail):
+        self.send_frame(topic, {"action": "error", "detail": detail})
+
+    def subscribe_user_topic(self, topic):
+        if topic in self.user_topics:
+            return
+        async_to_sync(self.channel_layer.group_add)(
+            user_group(self.scope["user"].id, topic), self.channel_name
+        )
+        self.user_topics.add(topic)
+        self.register_presence(topic)
+
+    def unsubscribe_user_topic(self, topic):
+        if topic not in self.user_topics:
+            return
+        async_to_sync(self.channel_layer.group_discard)(
+            user_group(self.scope["user"].id, topic), self.channel_name
+        )
+        self.user_topics.discard(topic)
+        self.unregister_presence(topic)
+
+    # Receive frame from WebSocket
+    def receive(self, text_data=None, bytes_data=None):
+        text_data_json = self.load_payload(text_data, bytes_data)
+        action = text_data_json.get('action')
+        topic = text_data_json.get('topic')
+        room_id = parse_room_topic(topic)
+
+        if action == 'subscribe':
+            if topic in USER_TOPICS:
+                self.subscribe_user_topic(topic)
+            elif room_id is None:
+                return self.send_error(topic, "Unknown topic.")
+            elif topic not in self.rooms and not self.join_room(room_id):
+                return self.send_error(topic, "You must be a member to join this chat.")
+            self.send_frame(topic, {"action": "subscribed"})
+
+        elif action == 'unsubscribe':
+            if topic in USER_TOPICS:
+                self.unsubscribe_user_topic(topic)
+            elif topic in self.rooms:
+                self.leave_room(room_id)
+            self.send_frame(topic, {"action": "unsubscribed"})
+
+        elif topic in self.rooms:
+            self.receive_room_action(room_id, text_data_json)
+
+        else:
+            self.send_error(topic, "Subscribe to this topic first.")
+
+    # Receive message from room or user group
+    def chat_message(self, event):
+        topic = event.get("topic")
+        if topic in self.rooms:
+            self.room_message(event)
+        elif topic in self.user_topics:
+            self.send_frame(topic, {field: event[field] for field in USER_TOPIC_FIELDS[topic]})
+
+
+class ChatRoomListConsumer(FramingMixin, PresenceMixin, WebsocketConsumer):
+    presence_kind = presence.CHAT_LIST
 
-class ChatRoomListConsumer(WebsocketConsumer):
     def connect(self):
         # Make group for each user
         self.user_id = self.scope["user"].id
-        self.user_group_id = f"user_{self.user_id}_chat_list"
+        self.user_group_id = user_group(self.user_id, presence.CHAT_LIST)
 
         async_to_sync(self.channel_layer.group_add)(
             self.user_group_id, self.channel_name
         )
 
         self.accept()
+        self.register_presence()
 
     def disconnect(self, close_code):
         async_to_sync(self.channel_layer.group_discard)(
             self.user_group_id, self.channel_name
         )
+        self.unregister_presence()
 
     # Receive message from room group
     def chat_message(self, event):
@@ -297,27 +485,31 @@ class ChatRoomListConsumer(WebsocketConsumer):
         unread_cnt = event["unreadCnt"]
 
         # Send message to WebSocket
-        self.send(text_data=json.dumps({
+        self.send_payload({
             "content": content, "roomId": room_id, "timestamp": timestamp, "unreadCnt": unread_cnt
-        }))
+        })
 
 
-class FriendListConsumer(WebsocketConsumer):
+class FriendListConsumer(FramingMixin, PresenceMixin, WebsocketConsumer):
+    presence_kind = presence.FRIEND_LIST
+
     def connect(self):
         # Make group for each user
         self.user_id = self.scope["user"].id
-        self.user_group_id = f"user_{self.user_id}_friend_list"
+        self.user_group_id = user_group(self.user_id, presence.FRIEND_LIST)
 
         async_to_sync(self.channel_layer.group_add)(
             self.user_group_id, self.channel_name
         )
 
         self.accept()
+        self.register_presence()
 
     def disconnect(self, close_code):
         async_to_sync(self.channel_layer.group_discard)(
             self.user_group_id, self.channel_name
         )
+        self.unregister_presence()
 
     # Receive message from room group
     def chat_message(self, event):
@@ -325,33 +517,37 @@ class FriendListConsumer(WebsocketConsumer):
         unread_cnt = event["unreadCnt"]
 
         # Send message to WebSocket
-        self.send(text_data=json.dumps({
+        self.send_payload({
             "friendId": friend_id, "unreadCnt": unread_cnt
-        }))
+        })
+
 
+class ChatIconConsumer(FramingMixin, PresenceMixin, WebsocketConsumer):
+    presence_kind = presence.CHAT_ICON
 
-class ChatIconConsumer(WebsocketConsumer):
     def connect(self):
         # Make group for each user
         self.user_id = self.scope["user"].id
-        self.user_group_id = f"user_{self.user_id}_chat_icon"
+        self.user_group_id = user_group(self.user_id, presence.CHAT_ICON)
 
         async_to_sync(self.channel_layer.group_add)(
             self.user_group_id, self.channel_name
         )
 
         self.accept()
+        self.register_presence()
 
     def disconnect(self, close_code):
         async_to_sync(self.channel_layer.group_discard)(
             self.user_group_id, self.channel_name
         )
+        self.unregister_presence()
 
     # Receive message from room group
     def chat_message(self, event):
         unread_cnt = event["unreadCnt"]
 
         # Send message to WebSocket
-        self.send(text_data=json.dumps({
+        self.send_payload({
             "unreadCnt": unread_cnt
-        }))
+        })
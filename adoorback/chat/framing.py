@@ -0,0 +1,70 @@
+import json
+
+import msgpack
+
+
+# clients asking for this websocket subprotocol get msgpack binary frames with short field codes;
+# everyone else keeps getting JSON text frames with the full field names
+MSGPACK_SUBPROTOCOL = 'adoor.msgpack'
+
+FIELD_CODES = {
+    'action': 'a',
+    'topic': 't',
+    'content': 'c',
+    'roomId': 'r',
+    'friendId': 'f',
+    'userId': 'u',
+    'userName': 'un',
+    'timestamp': 'ts',
+    'messageId': 'm',
+    'parentId': 'p',
+    'parentContent': 'pc',
+    'unreadCnt': 'n',
+    'messageLikeId': 'l',
+    'messageLikeCnt': 'lc',
+    'currentUserMessageLikeId': 'cl',
+    'fromMessageId': 'fm',
+    'toMessageId': 'tm',
+    'detail': 'd',
+    'notificationId': 'ni',
+    'messageKo': 'mk',
+    'messageEn': 'me',
+    'redirectUrl': 'ru',
+    'updatedAt': 'ua',
+    'deltaCursor': 'dc',
+    'unreadNotiCnt': 'nc',
+}
+FIELD_NAMES = {code: name for name, code in FIELD_CODES.items()}
+
+
+def encode_frame(payload):
+    return msgpack.packb({FIELD_CODES.get(name, name): value for name, value in payload.items()},
+                         use_bin_type=True)
+
+
+def decode_frame(data):
+    return {FIELD_NAMES.get(code, code): value for code, value in msgpack.unpackb(data, raw=False).items()}
+
+
+class FramingMixin:
+    """
+    Negotiates the wire format of a websocket consumer in the handshake.
+    """
+    binary_frames = False
+
+    def accept(self, subprotocol=None):
+        if subprotocol is None and MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", []):
+            self.binary_frames = True
+            subprotocol = MSGPACK_SUBPROTOCOL
+        super().accept(subprotocol=subprotocol)
+
+    def send_payload(self, payload):
+        if self.binary_frames:
+            self.send(bytes_data=encode_frame(payload))
+        else:
+            self.send(text_data=json.dumps(payload))
+
+    def load_payload(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            return decode_frame(bytes_data)
+        return json.loads(text_data)
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.14 on 2026-10-19 14:39
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_merge_0003_auto_20240323_0026_0003_message_parent'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='message',
+            name='normalized_content',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunSQL(
+            "UPDATE chat_message SET normalized_content = lower(replace(content, ' ', ''))",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['normalized_content'], name='message_normalized_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
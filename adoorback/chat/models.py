@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.db.models import Q
@@ -8,6 +9,7 @@ from django.dispatch import receiver
 from firebase_admin.messaging import Message
 
 from adoorback.models import AdoorModel, AdoorTimestampedModel
+from chat.cache import get_room_member_ids, invalidate_chat_rooms, is_room_member
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE_CASCADE
 
@@ -16,6 +18,11 @@ DEFAULT_TIMESTAMP = '2008-10-03'
 User = get_user_model()
 
 
+def normalize_message_content(content):
+    # search is case- and space-insensitive, so both stored content and queries are compared in this form
+    return (content or '').replace(' ', '').lower()
+
+
 class ChatRoom(AdoorTimestampedModel, SafeDeleteModel):
     users = models.ManyToManyField(User, related_name='chat_rooms')
     active = models.BooleanField(default=True)
@@ -29,9 +36,15 @@ class ChatRoom(AdoorTimestampedModel, SafeDeleteModel):
         super().clean()
         # Check if users in the chatroom are friends
         if self.active:
-            for user in self.users.all():
-                for other_user in self.users.exclude(id=user.id):
-                    if not user.is_connected(other_user):
+            from account.models import Connection
+            member_ids = sorted(get_room_member_ids(self.id))
+            connected_pairs = set(Connection.objects.filter(
+                user1_id__in=member_ids, user2_id__in=member_ids
+            ).values_list('user1_id', 'user2_id'))
+            for i, user_id in enumerate(member_ids):
+                for other_user_id in member_ids[i + 1:]:
+                    if (user_id, other_user_id) not in connected_pairs and \
+                            (other_user_id, user_id) not in connected_pairs:
                         raise ValidationError("All users in the chatroom must be friends.")
 
     @property
@@ -43,7 +56,7 @@ class ChatRoom(AdoorTimestampedModel, SafeDeleteModel):
         return self.messages.last().timestamp
 
     def unread_cnt(self, user):
-        if user not in self.users.all():
+        if not is_room_member(self.id, user.id):
             return -1
 
         user_last_msg = self.chat_activities.filter(user=user).first().last_read_message
@@ -53,28 +66,60 @@ class ChatRoom(AdoorTimestampedModel, SafeDeleteModel):
             threshold_id = 0
         return self.messages.filter(id__gt=threshold_id).count()
 
+    def read_receipts(self, message_ids):
+        '''
+        Return {message_id: (read_users_cnt, unread_users_cnt)} for the given messages of this room,
+        loading every member's last read message once instead of counting per message.
+        '''
+        member_cnt = self.users.count()
+        last_read_ids = sorted(
+            (last_read_id or 0 for last_read_id in UserChatActivity.objects.filter(
+                chat_room=self, user__in=self.users.all()
+            ).values_list('last_read_message_id', flat=True)),
+            reverse=True
+        )
+
+        # sweep messages from newest to oldest; readers of a message are members whose last read id is >= it
+        receipts = {}
+        read_cnt = 0
+        for message_id in sorted(message_ids, reverse=True):
+            while read_cnt < len(last_read_ids) and last_read_ids[read_cnt] >= message_id:
+                read_cnt += 1
+            receipts[message_id] = (read_cnt, member_cnt - read_cnt)
+        return receipts
+
 
 class Message(AdoorModel, SafeDeleteModel):
     sender = models.ForeignKey(User, related_name='sent_messages', on_delete=models.CASCADE)
     chat_room = models.ForeignKey(ChatRoom, related_name='messages', on_delete=models.CASCADE)
     timestamp = models.DateTimeField(blank=False, null=False, default=DEFAULT_TIMESTAMP)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    normalized_content = models.TextField(blank=True, default='', editable=False)
 
     _safedelete_policy = SOFT_DELETE_CASCADE
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['normalized_content'], opclasses=['gin_trgm_ops'], name='message_normalized_trgm_idx'),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender} in {self.chat_room}: {self.content}"
-    
+
+    def save(self, *args, **kwargs):
+        self.normalized_content = normalize_message_content(self.content)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'normalized_content'}
+        super().save(*args, **kwargs)
+
     @property
     def read_users_cnt(self):
-        return UserChatActivity.objects.filter(
-            last_read_message__chat_room=self.chat_room, 
-            last_read_message__id__gte=self.id
-        ).count()
+        return self.chat_room.read_receipts([self.id])[self.id][0]
 
     @property
     def unread_users_cnt(self):
-        return self.chat_room.users.count() - self.read_users_cnt()
+        return self.chat_room.read_receipts([self.id])[self.id][1]
 
 
 class MessageLike(AdoorTimestampedModel, SafeDeleteModel):
@@ -121,6 +166,22 @@ def create_user_chat_activities(sender, instance, action, pk_set, **kwargs):
             UserChatActivity.objects.create(user=user, chat_room=instance)
 
 
+@receiver(m2m_changed, sender=ChatRoom.users.through)
+def invalidate_chat_room_members(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if reverse:  # instance is a user and pk_set holds chat room ids
+        room_ids = pk_set or set(instance.chat_rooms.values_list('id', flat=True))
+        user_ids = {instance.id}
+    else:
+        room_ids = {instance.id}
+        user_ids = set(pk_set or [])
+    # membership change also changes which rooms are 1:1 for every other member
+    user_ids |= set(sender.objects.filter(chatroom_id__in=room_ids).values_list('user_id', flat=True))
+    invalidate_chat_rooms(room_ids, user_ids)
+
+
 @transaction.atomic
 @receiver(post_save, sender=Message)
 def sender_read_message(created, instance, **kwargs):
@@ -136,3 +197,9 @@ def sender_read_message(created, instance, **kwargs):
 @receiver(post_save, sender=ChatRoom)
 def validate_chatroom(sender, instance, **kwargs):
     instance.full_clean()
+
+
+@receiver(post_save, sender=ChatRoom)
+def invalidate_one_on_one_rooms(sender, instance, **kwargs):
+    # active flag decides whether the room is listed as a 1:1 room
+    invalidate_chat_rooms(user_ids=get_room_member_ids(instance.id))
@@ -0,0 +1,163 @@
+import threading
+import time
+import traceback
+
+import redis
+from django.conf import settings
+
+from adoorback.utils.alerts import send_msg_to_slack
+
+
+CHAT = 'chat'
+CHAT_LIST = 'chat_list'
+FRIEND_LIST = 'friend_list'
+CHAT_ICON = 'chat_icon'
+NOTIFICATION = 'notification'
+SOCKET_KINDS = (CHAT, CHAT_LIST, FRIEND_LIST, CHAT_ICON, NOTIFICATION)
+
+PRESENCE_KEY = 'presence:{kind}:{user_id}'
+
+# every process re-registers the sockets it holds on this interval, whether they see traffic or not;
+# a socket counts as open for a few intervals after, so sockets of a crashed worker stop counting quickly
+PRESENCE_HEARTBEAT_SECONDS = 30
+PRESENCE_TIMEOUT = PRESENCE_HEARTBEAT_SECONDS * 4
+# a failing heartbeat is reported at most once per this many seconds
+HEARTBEAT_ALERT_SECONDS = 60 * 10
+
+_redis_client = None
+_local_sockets = {}  # stand-in when no REDIS_URL is configured (tests, single process)
+_local_lock = threading.Lock()
+_process_sockets = set()  # (user_id, kind, channel_name) of sockets open in this process
+_heartbeat_thread = None
+
+
+def _get_redis_client():
+    global _redis_client
+    if _redis_client is None and settings.REDIS_URL:
+        options = {'ssl_cert_reqs': None} if settings.REDIS_URL.startswith('rediss://') else {}
+        _redis_client = redis.Redis.from_url(settings.REDIS_URL, **options)
+    return _redis_client
+
+
+def _touch(sockets):
+    now = time.time()
+    client = _get_redis_client()
+    if client is None:
+        with _local_lock:
+            for user_id, kind, channel_name in sockets:
+                _local_sockets.setdefault(PRESENCE_KEY.format(kind=kind, user_id=user_id), {})[channel_name] = now
+        return
+
+    pipe = client.pipeline(transaction=False)
+    for user_id, kind, channel_name in sockets:
+        key = PRESENCE_KEY.format(kind=kind, user_id=user_id)
+        pipe.zadd(key, {channel_name: now})
+        pipe.zremrangebyscore(key, '-inf', now - PRESENCE_TIMEOUT)
+        pipe.expire(key, PRESENCE_TIMEOUT)
+    pipe.execute()
+
+
+def _heartbeat():
+    last_alert_at = 0
+    while True:
+        time.sleep(PRESENCE_HEARTBEAT_SECONDS)
+        with _local_lock:
+            sockets = list(_process_sockets)
+        if not sockets:
+            continue
+        try:
+            _touch(sockets)
+        except Exception as e:
+            # keep beating; while it fails, the sockets of this process stop counting once PRESENCE_TIMEOUT passes
+            if time.time() - last_alert_at > HEARTBEAT_ALERT_SECONDS:
+                last_alert_at = time.time()
+                stack_trace = traceback.format_exc()
+                send_msg_to_slack(
+                    text=f"🚨 Presence heartbeat failed for {len(sockets)} socket(s): {e}\n```{stack_trace}```",
+                    level="WARNING"
+                )
+
+
+def _start_heartbeat():
+    global _heartbeat_thread
+    with _local_lock:
+        if _heartbeat_thread is None:
+            _heartbeat_thread = threading.Thread(target=_heartbeat, name='presence-heartbeat', daemon=True)
+            _heartbeat_thread.start()
+
+
+def socket_connected(user_id, kind, channel_name):
+    """
+    Register an open socket of user. It is kept alive by this process's heartbeat until socket_disconnected.
+    """
+    with _local_lock:
+        _process_sockets.add((user_id, kind, channel_name))
+    _start_heartbeat()
+    try:
+        _touch([(user_id, kind, channel_name)])
+    except redis.RedisError:
+        pass  # the heartbeat retries it
+
+
+def socket_disconnected(user_id, kind, channel_name):
+    key = PRESENCE_KEY.format(kind=kind, user_id=user_id)
+    with _local_lock:
+        _process_sockets.discard((user_id, kind, channel_name))
+    client = _get_redis_client()
+    if client is None:
+        with _local_lock:
+            sockets = _local_sockets.get(key, {})
+            sockets.pop(channel_name, None)
+            if not sockets:
+                _local_sockets.pop(key, None)
+        return
+
+    try:
+        client.zrem(key, channel_name)
+    except redis.RedisError:
+        pass
+
+
+def socket_count(user_id, kind):
+    key = PRESENCE_KEY.format(kind=kind, user_id=user_id)
+    min_score = time.time() - PRESENCE_TIMEOUT
+    client = _get_redis_client()
+    if client is None:
+        with _local_lock:
+            return sum(1 for seen in _local_sockets.get(key, {}).values() if seen >= min_score)
+
+    try:
+        return client.zcount(key, min_score, '+inf')
+    except redis.RedisError:
+        return 1  # fail open: do the work rather than drop a push
+
+
+def has_sockets(user_id, kind):
+    return socket_count(user_id, kind) > 0
+
+
+def is_online(user_id, kinds=SOCKET_KINDS):
+    return any(has_sockets(user_id, kind) for kind in kinds)
+
+
+def online_user_ids(user_ids, kinds=SOCKET_KINDS):
+    """
+    Return the subset of user_ids with a socket of any of kinds open, with one redis round trip.
+    """
+    user_ids = list(user_ids)
+    client = _get_redis_client()
+    if client is None:
+        return {user_id for user_id in user_ids if is_online(user_id, kinds)}
+
+    min_score = time.time() - PRESENCE_TIMEOUT
+    try:
+        pipe = client.pipeline(transaction=False)
+        for user_id in user_ids:
+            for kind in kinds:
+                pipe.zcount(PRESENCE_KEY.format(kind=kind, user_id=user_id), min_score, '+inf')
+        counts = pipe.execute()
+    except redis.RedisError:
+        return set()  # callers skip online users; rather push to everyone than to nobody
+
+    kind_cnt = len(kinds)
+    return {user_id for i, user_id in enumerate(user_ids) if any(counts[i * kind_cnt:(i + 1) * kind_cnt])}
@@ -4,6 +4,7 @@ from django.urls import path, re_path
 from . import consumers
 
 websocket_urlpatterns = [
+    re_path(r"ws/realtime/$", consumers.RealtimeConsumer.as_asgi()),
     re_path(r"ws/chat/(?P<room_id>\d+)/$", consumers.ChatConsumer.as_asgi()),
     re_path(r"ws/chat/chat_list/$", consumers.ChatRoomListConsumer.as_asgi()),
     re_path(r"ws/chat/friend_list/$", consumers.FriendListConsumer.as_asgi()),
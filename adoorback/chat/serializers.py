@@ -44,11 +44,11 @@ class ChatRoomMessageSerializer(MessageMinimalSerializer):
     parent_content = serializers.SerializerMethodField()
     current_user_message_like_id = serializers.SerializerMethodField(read_only=True)
     message_like_cnt = serializers.SerializerMethodField(read_only=True)
+    read_users_cnt = serializers.SerializerMethodField(read_only=True)
+    unread_users_cnt = serializers.SerializerMethodField(read_only=True)
 
     def get_parent_id(self, obj):
-        if obj.parent:
-            return obj.parent.id
-        return None
+        return obj.parent_id
 
     def get_parent_content(self, obj):
         if obj.parent:
@@ -56,23 +56,41 @@ class ChatRoomMessageSerializer(MessageMinimalSerializer):
         return None
 
     def get_current_user_message_like_id(self, obj):
+        # annotated by ChatMessagesListView; fall back to a lookup for other callers
+        if hasattr(obj, 'current_user_message_like_id'):
+            return obj.current_user_message_like_id
         current_user_id = self.context['request'].user.id
         message_like = MessageLike.objects.filter(user_id=current_user_id, message_id=obj.id)
         return message_like[0].id if message_like else None
 
     def get_message_like_cnt(self, obj):
+        if hasattr(obj, 'message_like_cnt'):
+            return obj.message_like_cnt
         return MessageLike.objects.filter(message_id=obj.id).count()
 
+    def get_read_users_cnt(self, obj):
+        receipts = self.context.get('read_receipts')
+        if receipts is not None and obj.id in receipts:
+            return receipts[obj.id][0]
+        return obj.read_users_cnt
+
+    def get_unread_users_cnt(self, obj):
+        receipts = self.context.get('read_receipts')
+        if receipts is not None and obj.id in receipts:
+            return receipts[obj.id][1]
+        return obj.unread_users_cnt
+
     class Meta(MessageMinimalSerializer.Meta):
         model = Message
-        fields = MessageMinimalSerializer.Meta.fields + ['parent_id', 'parent_content', 'current_user_message_like_id', 'message_like_cnt']
+        fields = MessageMinimalSerializer.Meta.fields + ['parent_id', 'parent_content', 'current_user_message_like_id', 'message_like_cnt',
+                                                       'read_users_cnt', 'unread_users_cnt']
 
 
 class SearchMessageSerializer(MessageMinimalSerializer):
     chat_room_id = serializers.SerializerMethodField()
 
     def get_chat_room_id(self, obj):
-        return obj.chat_room.id
+        return obj.chat_room_id
 
     class Meta(MessageMinimalSerializer.Meta):
         model = Message
@@ -0,0 +1,30 @@
+import re
+
+from chat import presence
+
+
+# per-user topics share their names with the presence socket kinds they register
+USER_TOPICS = (presence.CHAT_LIST, presence.FRIEND_LIST, presence.CHAT_ICON, presence.NOTIFICATION)
+
+ROOM_TOPIC = 'chat:{room_id}'
+ROOM_TOPIC_REGEX = re.compile(r'^chat:(\d+)$')
+
+
+def room_topic(room_id):
+    return ROOM_TOPIC.format(room_id=room_id)
+
+
+def parse_room_topic(topic):
+    """
+    Return the chat room id of a room topic, or None if topic is not one.
+    """
+    match = ROOM_TOPIC_REGEX.match(topic or '')
+    return int(match.group(1)) if match else None
+
+
+def room_group(room_id):
+    return f"chat_{room_id}"
+
+
+def user_group(user_id, topic):
+    return f"user_{user_id}_{topic}"
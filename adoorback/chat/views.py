@@ -1,15 +1,16 @@
 from collections import OrderedDict
 
-from django.db.models import F, Value, TextField
-from django.db.models.functions import Lower, Replace
+from django.db.models import Count, OuterRef, Q, Subquery
 from rest_framework import generics, exceptions
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from account.models import User
+from adoorback.utils.pagination import OptInCursorPagination
 from adoorback.utils.validators import adoor_exception_handler
-from chat.models import Message, ChatRoom, MessageLike
+from chat.cache import get_one_on_one_room_ids, is_room_member
+from chat.models import Message, ChatRoom, MessageLike, normalize_message_content
 import chat.serializers as cs
 from collections import OrderedDict
 
@@ -39,6 +40,10 @@ class ReversePagination(PageNumberPagination):
         ]))
 
 
+class MessageSearchPagination(OptInCursorPagination):
+    ordering = ('-timestamp', '-id')
+
+
 class ChatRoomDetail(generics.RetrieveAPIView):
     serializer_class = cs.ChatRoomSerializer
     permission_classes = [IsAuthenticated]
@@ -55,7 +60,7 @@ class ChatRoomDetail(generics.RetrieveAPIView):
         except ChatRoom.DoesNotExist:
             raise exceptions.NotFound("ChatRoom not found")
 
-        if current_user not in chat_room.users.all():
+        if not is_room_member(chat_room.id, current_user.id):
             raise exceptions.PermissionDenied("You are not a member of this chat room")
 
         return chat_room
@@ -90,24 +95,23 @@ class ChatMessageSearch(generics.ListAPIView):
     Get chatroom messages that contain query.
     '''
     serializer_class = cs.SearchMessageSerializer
+    pagination_class = MessageSearchPagination
     permission_classes = [IsAuthenticated]
 
     def get_exception_handler(self):
         return adoor_exception_handler
 
     def get_queryset(self):
-        query = self.request.GET.get('query', '').replace(" ", "").lower()
+        query = normalize_message_content(self.request.GET.get('query', ''))
         user = self.request.user
-        chat_rooms = user.chat_rooms.filter(active=True)
 
         if query:
+            # normalized_content is already lowercased, so a plain LIKE can use the trigram index
             messages = Message.objects.filter(
-                chat_room__in=chat_rooms
-            ).annotate(
-                lower_content=Lower(Replace(F('content'), Value(" "), Value(""), output_field=TextField()))
-            ).filter(
-                lower_content__icontains=query
-            ).order_by('-timestamp')
+                chat_room__users=user,
+                chat_room__active=True,
+                normalized_content__contains=query,
+            ).select_related('sender')
             return messages
 
         return Message.objects.none()
@@ -121,14 +125,30 @@ class ChatMessagesListView(generics.ListAPIView):
     def get_queryset(self):
         try:
             chat_room = ChatRoom.objects.get(id=self.kwargs.get('pk'))
-            if self.request.user not in chat_room.users.all():
+            if not is_room_member(chat_room.id, self.request.user.id):
                 raise exceptions.PermissionDenied("You are not in this chat room")
         except ChatRoom.DoesNotExist:
             raise exceptions.NotFound("Chat room not found")
-
-        chat_messages = Message.objects.filter(chat_room__id=self.kwargs.get('pk')).order_by('-id')
+        self.chat_room = chat_room
+
+        current_user_like = MessageLike.objects.filter(user=self.request.user, message_id=OuterRef('pk'))
+        chat_messages = Message.objects.filter(chat_room__id=self.kwargs.get('pk')) \
+            .select_related('sender', 'parent') \
+            .annotate(message_like_cnt=Count('message_likes', filter=Q(message_likes__deleted__isnull=True)),
+                      current_user_message_like_id=Subquery(current_user_like.values('id')[:1])) \
+            .order_by('-id')
         return chat_messages
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+
+        # read receipts for the whole page are computed from one load of members' last read messages
+        context = self.get_serializer_context()
+        context['read_receipts'] = self.chat_room.read_receipts([message.id for message in page])
+        serializer = self.get_serializer(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
+
 
 class OneOnOneChatRoomId(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
@@ -145,15 +165,13 @@ class OneOnOneChatRoomId(generics.RetrieveAPIView):
         if friend == current_user:
             raise exceptions.PermissionDenied("You cannot chat with yourself")
 
-        if not current_user.is_connected(friend):
-            raise exceptions.PermissionDenied("You are not friends with this user")
-
-        try:
-            chat_room = ChatRoom.objects.filter(users=current_user).filter(users=friend).first()
-        except ChatRoom.DoesNotExist:
+        chat_room_id = get_one_on_one_room_ids(current_user.id).get(friend.id)
+        if chat_room_id is None:
+            if not current_user.is_connected(friend):
+                raise exceptions.PermissionDenied("You are not friends with this user")
             raise exceptions.NotFound("Chat room not found")
 
-        return Response({'chat_room_id': chat_room.id})
+        return Response({'chat_room_id': chat_room_id})
 
 
 class MessageLikeList(generics.ListAPIView):
@@ -5,7 +5,6 @@ from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.auth import get_user_model
 from django.dispatch import receiver
 from django.db.models.signals import post_save
-from django.db import IntegrityError
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE_CASCADE
 from safedelete.managers import SafeDeleteManager
@@ -16,8 +15,8 @@ from adoorback.utils.helpers import wrap_content
 from adoorback.utils.content_types import get_comment_type, get_generic_relation_type
 from content_report.models import ContentReport
 from like.models import Like
-from notification.models import Notification, NotificationActor
-from user_tag.models import UserTag
+from notification.models import Notification
+from user_tag.models import UserTag, create_comment_user_tag_notis
 from utils.helpers import parse_user_tag_from_content
 
 
@@ -83,69 +82,39 @@ def create_noti(instance, created, **kwargs):
     target = instance
 
     content_preview = wrap_content(instance.content)
+    # reports go both ways, so this also covers users who blocked the actor
+    blocked_ids = set(actor.user_report_blocked_ids)
+    notifications = []
+
+    def add_noti(user_id, message_ko, message_en):
+        notifications.append(Notification(user_id=user_id,
+                                          origin_id=origin.id,
+                                          origin_type=get_generic_relation_type(origin.type),
+                                          target_id=target.id,
+                                          target_type=get_comment_type(),
+                                          message_ko=message_ko,
+                                          message_en=message_en,
+                                          redirect_url=redirect_url))
 
     # if is_reply
     if origin.type == 'Comment':
         redirect_url = f'/{origin.target.type.lower()}s/{origin.target.id}'
         # send a notification to the author of the origin comment
-        if origin_author == actor:
-            pass
-        elif actor.id in origin_author.user_report_blocked_ids:
-            pass
-        else:
-            noti = Notification.objects.create(user=origin_author,
-                                               origin_id=origin.id,
-                                               origin_type=get_generic_relation_type(origin.type),
-                                               target_id=target.id,
-                                               target_type=get_comment_type(),
-                                               message_ko=f'{actor.username}이 회원님의 댓글에 답글을 남겼습니다: "{content_preview}"',
-                                               message_en=f'{actor.username} has replied to your comment: "{content_preview}"',
-                                               redirect_url=redirect_url)
-            NotificationActor.objects.create(user=actor, notification=noti)
+        if origin_author.id != actor.id and origin_author.id not in blocked_ids:
+            add_noti(origin_author.id,
+                     f'{actor.username}이 회원님의 댓글에 답글을 남겼습니다: "{content_preview}"',
+                     f'{actor.username} has replied to your comment: "{content_preview}"')
 
         # send a notification to the author of the qna where the origin comment commented
-        post_author = origin.target.author
-        if post_author == origin_author:
-            pass
-        elif post_author == actor:
-            pass
-        elif actor.id in post_author.user_report_blocked_ids:
-            pass
-        else:
-            noti = Notification.objects.create(user=post_author,
-                                               origin_id=origin.id,
-                                               origin_type=get_generic_relation_type(origin.type),
-                                               target_id=target.id,
-                                               target_type=get_comment_type(),
-                                               message_ko=f'회원님의 답변에 달린 댓글에 새로운 답글이 달렸습니다: "{content_preview}"',
-                                               message_en=f'Someone replied to a comment on your response: "{content_preview}"',
-                                               redirect_url=redirect_url)
-            NotificationActor.objects.create(user=actor, notification=noti)
-
-        # send notifications to participants of the origin comment
-        if not instance.is_private:
-            for participant_id in origin.participants:
-                if participant_id == origin_author.id:
-                    continue
-                if participant_id == post_author.id:
-                    continue
-                if participant_id == actor.id:
-                    continue
-                participant = User.objects.get(id=participant_id)
-                if actor.id in participant.user_report_blocked_ids:
-                    continue
-                content_type = ContentType.objects.get_for_model(origin).model
-                if (content_type, origin.id) in participant.content_report_blocked_model_ids:
-                    return
-                noti = Notification.objects.create(user=participant,
-                                                origin_id=origin.id,
-                                                origin_type=get_generic_relation_type(origin.type),
-                                                target_id=target.id,
-                                                target_type=get_comment_type(),
-                                                message_ko=f'회원님이 답글을 단 댓글에 새로운 답글이 달렸습니다: "{content_preview}"',
-                                                message_en=f'Someone replied to a comment you responded to: "{content_preview}"',
-                                                redirect_url=redirect_url)
-                NotificationActor.objects.create(user=actor, notification=noti)
+        post_author_id = origin.target.author_id
+        if post_author_id not in (origin_author.id, actor.id) and post_author_id not in blocked_ids:
+            add_noti(post_author_id,
+                     f'회원님의 답변에 달린 댓글에 새로운 답글이 달렸습니다: "{content_preview}"',
+                     f'Someone replied to a comment on your response: "{content_preview}"')
+
+        notified_ids = {origin_author.id, post_author_id, actor.id}
+        participant_message_ko = f'회원님이 답글을 단 댓글에 새로운 답글이 달렸습니다: "{content_preview}"'
+        participant_message_en = f'Someone replied to a comment you responded to: "{content_preview}"'
 
     # if not reply
     else:
@@ -153,43 +122,27 @@ def create_noti(instance, created, **kwargs):
         # send a notification to the author of the origin qna
         origin_target_name_ko = '게시글' if origin.type == 'Note' else '답변'
         origin_target_name_en = 'post' if origin.type == 'Note' else 'response'
-        if origin_author == actor:
-            pass
-        elif actor.id in origin_author.user_report_blocked_ids:
-            pass
-        else:
-            noti = Notification.objects.create(user=origin_author,
-                                               origin_id=origin.id,
-                                               origin_type=get_generic_relation_type(origin.type),
-                                               target_id=target.id,
-                                               target_type=get_comment_type(),
-                                               message_ko=f'{actor.username}님이 회원님의 {origin_target_name_ko}에 댓글을 남겼습니다: "{content_preview}"',
-                                               message_en=f'{actor.username} has commented on your {origin_target_name_en}: "{content_preview}"',
-                                               redirect_url=redirect_url)
-            NotificationActor.objects.create(user=actor, notification=noti)
-
-        # send notifications to participants of the origin qna
-        if not instance.is_private:
-            for participant_id in origin.participants:
-                if participant_id == origin_author.id:
-                    continue
-                if participant_id == actor.id:
-                    continue
-                participant = User.objects.get(id=participant_id)
-                if actor.id in participant.user_report_blocked_ids:
-                    continue
-                content_type = ContentType.objects.get_for_model(origin).model
-                if (content_type, origin.id) in participant.content_report_blocked_model_ids:
-                    return
-                noti = Notification.objects.create(user=participant,
-                                                origin_id=origin.id,
-                                                origin_type=get_generic_relation_type(origin.type),
-                                                target_id=target.id,
-                                                target_type=get_comment_type(),
-                                                message_ko=f'회원님이 댓글을 단 {origin_target_name_ko}에 새로운 댓글이 달렸습니다: "{content_preview}"',
-                                                message_en=f'A new comment was added to the {origin_target_name_en} you commented on: "{content_preview}"',
-                                                redirect_url=redirect_url)
-                NotificationActor.objects.create(user=actor, notification=noti)
+        if origin_author.id != actor.id and origin_author.id not in blocked_ids:
+            add_noti(origin_author.id,
+                     f'{actor.username}님이 회원님의 {origin_target_name_ko}에 댓글을 남겼습니다: "{content_preview}"',
+                     f'{actor.username} has commented on your {origin_target_name_en}: "{content_preview}"')
+
+        notified_ids = {origin_author.id, actor.id}
+        participant_message_ko = f'회원님이 댓글을 단 {origin_target_name_ko}에 새로운 댓글이 달렸습니다: "{content_preview}"'
+        participant_message_en = f'A new comment was added to the {origin_target_name_en} you commented on: "{content_preview}"'
+
+    # send notifications to participants of the origin comment / qna
+    if not instance.is_private:
+        participant_ids = set(origin.participants) - notified_ids - blocked_ids
+        if participant_ids:
+            participant_ids -= set(ContentReport.objects.filter(user_id__in=participant_ids,
+                                                                content_type=ContentType.objects.get_for_model(origin),
+                                                                object_id=origin.id).values_list('user_id', flat=True))
+        for participant_id in sorted(participant_ids):
+            add_noti(participant_id, participant_message_ko, participant_message_en)
+
+    if notifications:
+        Notification.objects.bulk_create_notifications(actor, notifications)
 
 
 @transaction.atomic
@@ -201,22 +154,22 @@ def create_user_tag(instance, **kwargs):
     content_type = get_generic_relation_type(instance.type)
 
     tagged_users, word_indices = parse_user_tag_from_content(content)
+    if not tagged_users:
+        return
+
+    # tags saved by an earlier save of the same comment (e.g. before an edit) are kept as they are
+    existing_tags = set(UserTag.objects.filter(tagging_user_id=tagging_user.id, object_id=object_id,
+                                               content_type=content_type).values_list('tagged_user_id', 'offset'))
 
     words = content.split(' ')
-    for i, tagged_user in enumerate(tagged_users):
-        tagged_username = tagged_user.username
-        word_idx = word_indices[i]
-        try:
-            offset = sum([len(w) for w in words[:word_idx]]) + word_idx + 1  # length of words + spaces + '@'
-            UserTag.objects.create(tagging_user_id=tagging_user.id, tagged_user_id=tagged_user.id,
-                                   object_id=object_id, content_type=content_type,
-                                   offset=offset, length=len(tagged_username), username_str=tagged_username)
-        except IntegrityError as e:
-            constraint_failed = False
-            for arg in e.args:
-                if 'constraint' in arg:
-                    constraint_failed = True
-            if constraint_failed:
-                continue
-            else:
-                print("error creating UserTag: ", e.args)
+    user_tags = []
+    for tagged_user, word_idx in zip(tagged_users, word_indices):
+        offset = sum([len(w) for w in words[:word_idx]]) + word_idx + 1  # length of words + spaces + '@'
+        if (tagged_user.id, offset) in existing_tags:
+            continue
+        user_tags.append(UserTag(tagging_user_id=tagging_user.id, tagged_user_id=tagged_user.id,
+                                 object_id=object_id, content_type=content_type,
+                                 offset=offset, length=len(tagged_user.username), username_str=tagged_user.username))
+
+    if user_tags:
+        create_comment_user_tag_notis(instance, UserTag.objects.bulk_create(user_tags))
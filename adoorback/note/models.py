@@ -19,8 +19,9 @@ from adoorback.models import AdoorModel
 from comment.models import Comment
 from content_report.models import ContentReport
 from like.models import Like
-from notification.models import Notification, NotificationActor
+from notification.models import Notification
 from reaction.models import Reaction
+from task.queue import task
 
 User = get_user_model()
 
@@ -164,28 +165,30 @@ def delete_image_file(sender, instance, **kwargs):
     instance.image.delete(save=False)
 
 
+@task
+def notify_subscribers(post_id):
+    post = Note.objects.select_related('author').filter(id=post_id).first()
+    if post is None:
+        return  # deleted before the task ran
+    author = post.author
+    notifications = [
+        Notification(
+            user_id=subscriber_id,
+            origin=post,
+            target=post,
+            message_ko=f'{author.username}님이 새 게시글을 작성했습니다.',
+            message_en=f'{author.username} has posted a new post.',
+            redirect_url=f'/notes/{post.id}'
+        )
+        for subscriber_id in Subscription.audience_subscriber_ids(post)
+    ]
+    if notifications:
+        Notification.objects.bulk_create_notifications(author, notifications)
+
+
 @receiver(post_save, sender=Note)
 def send_notifications_to_subscribers(sender, instance, created, **kwargs):
     if not created:
         return
-
-    author = instance.author
-    note_content_type = ContentType.objects.get_for_model(Note)
-    
-    subscribers = Subscription.objects.filter(
-        subscribed_to=author,
-        content_type=note_content_type,
-    ).values_list('subscriber', flat=True)
-
-    for subscriber_id in subscribers:
-        subscriber = get_user_model().objects.get(id=subscriber_id)
-        
-        noti = Notification.objects.create(
-            user=subscriber,
-            origin=instance,
-            target=instance,
-            message_ko=f'{author.username}님이 새 게시글을 작성했습니다.',
-            message_en=f'{author.username} has posted a new post.',
-            redirect_url=f'/notes/{instance.id}'
-        )
-        NotificationActor.objects.create(user=author, notification=noti)
+    # fanned out by the task worker, outside of the request's save transaction
+    notify_subscribers.delay(instance.id)
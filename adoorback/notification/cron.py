@@ -0,0 +1,32 @@
+from django.core.management import call_command
+from django_cron import CronJobBase, Schedule
+
+from notification.models import refresh_unread_noti_cnt
+
+
+class ReconcileUnreadNotiCntCronJob(CronJobBase):
+    schedule = Schedule(run_every_mins=60)
+    code = 'notification.reconcile_unread_noti_cnt_cron_job'
+
+    def do(self):
+        print('=========================')
+        print("Reconciling unread notification counters...............")
+
+        # counters drift when notifications change without signals (queryset deletes, stale user saves)
+        refresh_unread_noti_cnt()
+
+        print('Unread notification counters reconciled!')
+        print('=========================')
+
+
+class PruneNotificationsCronJob(CronJobBase):
+    schedule = Schedule(run_at_times=['12:00'])  # TIME_ZONE
+    code = 'notification.prune_notifications_cron_job'
+
+    def do(self):
+        print('=========================')
+        print("Pruning old notifications...............")
+
+        call_command('prune_notifications')
+
+        print('=========================')
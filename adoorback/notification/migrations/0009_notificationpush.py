@@ -0,0 +1,30 @@
+# Generated by Django 4.2.14 on 2026-10-19 14:52
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0008_alter_notification_message_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationPush',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registration_ids', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), blank=True, null=True, size=None)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pushes', to='notification.notification')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_attempt_at'], name='notificatio_next_at_7b1cba_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.14 on 2026-10-19 14:56
+
+from django.db import migrations, models
+
+
+def backfill_aggregation_keys(apps, schema_editor):
+    # give the live aggregate notifications their key, so new actors merge into them instead of
+    # starting a second notification; when duplicates exist, the most recently updated one wins
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    Notification = apps.get_model('notification', 'Notification')
+    Comment = apps.get_model('comment', 'Comment')
+    Reaction = apps.get_model('reaction', 'Reaction')
+
+    type_ids = {(ct.app_label, ct.model): ct.id for ct in ContentType.objects.all()}
+    like_type = type_ids.get(('like', 'like'))
+    response_request_type = type_ids.get(('qna', 'responserequest'))
+    reaction_type = type_ids.get(('reaction', 'reaction'))
+    comment_type = type_ids.get(('comment', 'comment'))
+    like_origin_kinds = {
+        type_ids.get(('qna', 'response')): 'like_response_noti',
+        type_ids.get(('note', 'note')): 'like_note_noti',
+    }
+
+    notifications = Notification.objects.filter(
+        deleted__isnull=True, target_type_id__in=[like_type, response_request_type, reaction_type],
+    ).only('id', 'user_id', 'target_type_id', 'target_id', 'origin_type_id', 'origin_id') \
+        .order_by('-notification_updated_at', '-id')
+    if not notifications.exists():
+        return
+
+    reply_ids = set(Comment.objects.filter(content_type_id=comment_type).values_list('id', flat=True))
+    reaction_emojis = dict(Reaction.objects.values_list('id', 'emoji'))
+
+    seen, updated = set(), []
+    for noti in notifications.iterator():
+        emoji = None
+        if noti.target_type_id == like_type:
+            if noti.origin_type_id == comment_type:
+                noti_type = 'like_reply_noti' if noti.origin_id in reply_ids else 'like_comment_noti'
+            else:
+                noti_type = like_origin_kinds.get(noti.origin_type_id)
+        elif noti.target_type_id == response_request_type:
+            noti_type = 'response_request_noti'
+        else:
+            noti_type = 'reaction_response_noti'
+            emoji = reaction_emojis.get(noti.target_id)
+        if noti_type is None or noti.origin_type_id is None:
+            continue
+
+        key = f'{noti_type}:{noti.origin_type_id}:{noti.origin_id}'
+        key = f'{key}:{emoji}' if emoji else key
+        if (noti.user_id, key) in seen:
+            continue
+        seen.add((noti.user_id, key))
+        noti.aggregation_key = key
+        updated.append(noti)
+
+    Notification.objects.bulk_update(updated, ['aggregation_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('comment', '0002_remove_comment_is_anonymous'),
+        ('reaction', '0001_initial'),
+        ('notification', '0009_notificationpush'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='aggregation_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(backfill_aggregation_keys, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('aggregation_key__isnull', False), ('deleted__isnull', True)), fields=('user', 'aggregation_key'), name='unique_notification_aggregation'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0011_notification_user_created_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'updated_at', 'id'], name='notificatio_user_id_dfd39c_idx'),
+        ),
+    ]
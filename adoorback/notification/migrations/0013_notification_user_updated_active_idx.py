@@ -0,0 +1,17 @@
+# Generated by Django 4.2.14 on 2026-10-19 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notification', '0012_notification_user_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('deleted__isnull', True)), fields=['user', '-notification_updated_at', '-id'], name='noti_user_updated_active_idx'),
+        ),
+    ]
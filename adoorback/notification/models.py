@@ -1,7 +1,11 @@
-import traceback
+
+from collections import Counter
 
 from django.contrib.contenttypes.fields import GenericForeignKey
-from django.db import models
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Window
+from django.db.models.functions import Coalesce
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.auth import get_user_model
 from django.db.models.signals import post_save
@@ -9,16 +13,33 @@ from django.dispatch import receiver
 from django.utils import timezone
 
 from adoorback.models import AdoorTimestampedModel
-from adoorback.utils.content_types import get_response_request_type, get_question_type
-from adoorback.utils.alerts import send_msg_to_slack
-from notification.helpers import find_like_noti, construct_message
+from notification.helpers import construct_message, find_like_noti, notification_aggregation_key
 
 from firebase_admin.messaging import Message
-from firebase_admin.messaging import Notification as FirebaseNotification
 from custom_fcm.models import CustomFCMDevice
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE_CASCADE, HARD_DELETE
 from safedelete.managers import SafeDeleteManager
+from task.queue import task
+
+
+# firebase accepts at most this many messages in one send_each request
+PUSH_BATCH_SIZE = 500
+
+# notifications are hard deleted (see prune_notifications) once created and last changed this many days ago
+NOTIFICATION_RETENTION_DAYS = 90
+
+# creates the aggregate notification of (user, aggregation_key) or, if it exists, brings it back up unread;
+# concurrent actors serialize on the unique index instead of creating duplicates
+NOTIFICATION_UPSERT_SQL = '''
+    INSERT INTO {table} (created_at, updated_at, notification_updated_at, deleted_by_cascade, user_id,
+                         target_type_id, target_id, origin_type_id, origin_id, redirect_url,
+                         message, message_ko, message_en, is_visible, is_read, aggregation_key)
+    VALUES (NOW(), NOW(), NOW(), FALSE, %s, %s, %s, %s, %s, %s, %s, %s, %s, TRUE, FALSE, %s)
+    ON CONFLICT (user_id, aggregation_key) WHERE aggregation_key IS NOT NULL AND deleted IS NULL
+    DO UPDATE SET updated_at = NOW(), notification_updated_at = NOW(), is_visible = TRUE, is_read = FALSE
+    RETURNING id, (xmax = 0) AS inserted
+'''
 
 
 class NotificationManager(SafeDeleteManager):
@@ -35,79 +56,103 @@ class NotificationManager(SafeDeleteManager):
 
     def create_or_update_notification(self, actor, user, origin, target, noti_type, redirect_url, content_en, content_ko,
                                       emoji=None):
-        noti_to_update = None
+        aggregation_key = notification_aggregation_key(noti_type, origin, emoji)
 
-        if target.type == "Like":
+        if target.type == "Like" and hasattr(target, 'deleted') and target.deleted:
             noti_to_update = find_like_noti(user, origin, noti_type)
-            if noti_to_update and hasattr(target, 'deleted') and target.deleted:
-                # need to hard delete because if soft deleted, NotificationActor is still accessible through notification.actors field (MTM)
-                NotificationActor.objects.filter(user=actor, notification=noti_to_update).delete(force_policy=HARD_DELETE)
-                actors = noti_to_update.actors.order_by('-notificationactor__created_at')  # make the most recent actor come first in the notification message
-                N = actors.count()
-
-                if N == 0:
-                    noti_to_update.delete()
-                    return
-
-                first_actor = actors.first()
-                second_actor = actors[1] if actors.count() > 1 else None
-                updated_message_ko, updated_message_en = construct_message(
-                    noti_type,
-                    first_actor.username + "님",
-                    second_actor.username + "님" if second_actor else None,
-                    first_actor.username,
-                    second_actor.username if second_actor else None,
-                    N,
-                    content_en,
-                    content_ko,
-                    emoji
-                )
-                
-                noti_to_update.message_ko = updated_message_ko
-                noti_to_update.message_en = updated_message_en
-                noti_to_update.save()
+            if not noti_to_update:
                 return
-        elif target.type == "ResponseRequest":
-            noti_to_update = Notification.objects.filter(user=user,
-                                                         origin_id=target.question.id, origin_type=get_question_type(),
-                                                         target_type=get_response_request_type()).first()
-        elif target.type == "Reaction":
-            notis = Notification.objects.filter(user=user, origin_id=origin.id,
-                                                origin_type=ContentType.objects.get_for_model(origin),
-                                                target_type=ContentType.objects.get_for_model(target))
-            if notis.count() > 0:
-                for noti in notis:
-                    if noti.target.emoji == emoji:
-                        noti_to_update = noti
-                        break
-
-        if noti_to_update:
-            actors = noti_to_update.actors.order_by('-notificationactor__created_at')
+
+            # need to hard delete because if soft deleted, NotificationActor is still accessible through notification.actors field (MTM)
+            NotificationActor.objects.filter(user=actor, notification=noti_to_update).delete(force_policy=HARD_DELETE)
+            actors = noti_to_update.actors.order_by('-notificationactor__created_at')  # make the most recent actor come first in the notification message
             N = actors.count()
-            new_actor = actors.first()
-            updated_message_ko, updated_message_en = construct_message(noti_type,
-                                                                       actor.username + "님",
-                                                                       new_actor.username + "님",
-                                                                       actor.username,
-                                                                       new_actor.username,
-                                                                       N + 1,
-                                                                       content_en,
-                                                                       content_ko,
-                                                                       emoji)
+
+            if N == 0:
+                noti_to_update.delete()
+                return
+
+            first_actor = actors.first()
+            second_actor = actors[1] if actors.count() > 1 else None
+            updated_message_ko, updated_message_en = construct_message(
+                noti_type,
+                first_actor.username + "님",
+                second_actor.username + "님" if second_actor else None,
+                first_actor.username,
+                second_actor.username if second_actor else None,
+                N,
+                content_en,
+                content_ko,
+                emoji
+            )
 
             noti_to_update.message_ko = updated_message_ko
             noti_to_update.message_en = updated_message_en
-            noti_to_update.is_visible = True
-            noti_to_update.is_read = False
-            NotificationActor.objects.create(user=actor, notification=noti_to_update)
-            noti_to_update.notification_updated_at = timezone.now()
             noti_to_update.save()
+            return
+
+        message_ko, message_en = construct_message(noti_type, actor.username + "님", None,
+                                                   actor.username, None, 1, content_en, content_ko, emoji)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(NOTIFICATION_UPSERT_SQL.format(table=self.model._meta.db_table), [
+                    user.id,
+                    ContentType.objects.get_for_model(target).id, target.id,
+                    ContentType.objects.get_for_model(origin).id, origin.id,
+                    redirect_url, message_en, message_ko, message_en, aggregation_key,
+                ])
+                noti_id, inserted = cursor.fetchone()
+            NotificationActor.objects.create(user=actor, notification_id=noti_id)
+
+            if not inserted:
+                # the new actor comes first in the message, followed by the previous most recent one
+                recent_actors = list(NotificationActor.objects
+                                     .filter(notification_id=noti_id, user__deleted__isnull=True)
+                                     .annotate(actor_cnt=Window(Count('id')))
+                                     .order_by('-created_at', '-id')
+                                     .values_list('user__username', 'actor_cnt')[:2])
+                N = recent_actors[0][1]
+                second_actor = recent_actors[1][0] if len(recent_actors) > 1 else None
+                message_ko, message_en = construct_message(noti_type,
+                                                           actor.username + "님",
+                                                           second_actor + "님" if second_actor else None,
+                                                           actor.username,
+                                                           second_actor,
+                                                           N,
+                                                           content_en,
+                                                           content_ko,
+                                                           emoji)
+                self.filter(id=noti_id).update(message_ko=message_ko, message_en=message_en, updated_at=timezone.now())
+
+        # post_save is not sent for the upsert, so queue the push and update the unread counter here
+        if inserted:
+            increment_unread_noti_cnt([user.id])
         else:
-            message_ko, message_en = construct_message(noti_type, actor.username + "님", None,
-                                                       actor.username, None, 1, content_en, content_ko, emoji)
-            noti = Notification.objects.create(user=user, origin=origin, target=target, redirect_url=redirect_url,
-                                               message_ko=message_ko, message_en=message_en)
-            NotificationActor.objects.create(user=actor, notification=noti)
+            refresh_unread_noti_cnt([user.id])  # the notification may or may not have been unread before
+        transaction.on_commit(lambda: dispatch_notifications([noti_id]))
+
+    def bulk_create_notifications(self, actor, notifications):
+        """
+        Insert unsaved notifications sent by actor in batches and push them in batches.
+        Unlike create(), no post_save is sent per notification.
+        """
+        with transaction.atomic():
+            notifications = self.bulk_create(notifications, batch_size=PUSH_BATCH_SIZE)
+            NotificationActor.objects.bulk_create(
+                [NotificationActor(user=actor, notification=noti) for noti in notifications],
+                batch_size=PUSH_BATCH_SIZE
+            )
+
+            user_ids_by_cnt = {}
+            for user_id, cnt in Counter(noti.user_id for noti in notifications
+                                        if noti.is_visible and not noti.is_read).items():
+                user_ids_by_cnt.setdefault(cnt, []).append(user_id)
+            for cnt, user_ids in user_ids_by_cnt.items():
+                increment_unread_noti_cnt(user_ids, cnt)
+
+        notification_ids = [noti.id for noti in notifications]
+        transaction.on_commit(lambda: dispatch_notifications(notification_ids))
+        return notifications
 
     def find_recent_ping(self, user, actor):
         cutoff = timezone.now() - timezone.timedelta(minutes=5)
@@ -155,6 +200,9 @@ class Notification(AdoorTimestampedModel, SafeDeleteModel):
 
     notification_updated_at = models.DateTimeField(auto_now=True, null=True)
 
+    # merges notifications of the same kind on the same origin into one per user (see notification_aggregation_key)
+    aggregation_key = models.CharField(max_length=100, null=True, blank=True)
+
     objects = NotificationManager()
 
     _safedelete_policy = SOFT_DELETE_CASCADE
@@ -163,6 +211,18 @@ class Notification(AdoorTimestampedModel, SafeDeleteModel):
         ordering = ['-notification_updated_at']
         indexes = [
             models.Index(fields=['-notification_updated_at']),
+            # per-user lookups by creation time (unread counter, ver_changed_at filters)
+            models.Index(fields=['user', 'created_at']),
+            # delta sync (NotificationDelta)
+            models.Index(fields=['user', 'updated_at', 'id']),
+            # keyset pagination of the lists (NotificationPagination)
+            models.Index(fields=['user', '-notification_updated_at', '-id'], condition=Q(deleted__isnull=True),
+                         name='noti_user_updated_active_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'aggregation_key'],
+                                    condition=Q(aggregation_key__isnull=False, deleted__isnull=True),
+                                    name='unique_notification_aggregation'),
         ]
 
     def save(self, *args, **kwargs):
@@ -170,6 +230,11 @@ class Notification(AdoorTimestampedModel, SafeDeleteModel):
             self.notification_updated_at = self.created_at
         super().save(*args, **kwargs)
 
+    @property
+    def delta_cursor(self):
+        # `since` value of NotificationDelta that lists changes after this one
+        return f'{self.updated_at.isoformat()},{self.id}'
+
     def __str__(self):
         return f"@{self.user} {self.message}"
 
@@ -187,59 +252,96 @@ class NotificationActor(AdoorTimestampedModel, SafeDeleteModel):
         return f"actor {self.user} of notification \"{self.notification.message}\" (id: {self.notification.id})"
 
 
-def notify_firebase(instance):
-    devices = CustomFCMDevice.objects.filter(user_id=instance.user.id, active=True)
-    for device in devices:
-        body = instance.message_ko if device.language == 'ko' else instance.message_en
-        message = Message(
-            notification=FirebaseNotification(
-                title='WhoAmI Today',
-                body=body
-            ),
-            data={
-                'message_en': instance.message_en,
-                'message_ko': instance.message_ko,
-                'url': instance.redirect_url,
-                'tag': str(instance.id),
-                'type': 'new',
-                'content-available': '1',  # for ios silent notification
-                'priority': 'high',  # for android
-            }
-        )
-        try:
-            device.send_message(message)
-        except Exception as e:
-            stack_trace = traceback.format_exc()
-            send_msg_to_slack(
-                text=f"🚨 Failed to send firebase notification to device {device.id}: {e}\n```{stack_trace}```",
-                level="ERROR"
-            )
-            print(f"🚨 Failed to send firebase notification to device {device.id}: {e}\n```{stack_trace}```")
-            return False
+def increment_unread_noti_cnt(user_ids, cnt=1):
+    get_user_model().objects.filter(id__in=user_ids).update(unread_noti_cnt=F('unread_noti_cnt') + cnt)
+
+
+def refresh_unread_noti_cnt(user_ids=None):
+    '''
+    Recount the unread notification counter of users (all users if user_ids is None) in one UPDATE.
+    Used wherever notifications change in ways an increment can't follow, and to correct drift.
+    '''
+    unread_cnt = Notification.objects.filter(user=OuterRef('pk'), is_visible=True, is_read=False) \
+        .filter(Q(user__ver_changed_at__isnull=True) | Q(created_at__gte=F('user__ver_changed_at'))) \
+        .order_by().values('user').annotate(cnt=Count('id')).values('cnt')
+    users = get_user_model().objects.all()
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+    users.update(unread_noti_cnt=Coalesce(Subquery(unread_cnt), 0))
 
 
 @receiver(post_save, sender=Notification)
-def send_firebase_notification(sender, instance, created, **kwargs):
-    is_any_actor_active = instance.actors.filter(deleted__isnull=True).exists()
-    if (created or (not created and instance.is_visible and not instance.is_read)) and is_any_actor_active:
-        notify_firebase(instance)
+def update_unread_noti_cnt(sender, instance, created, **kwargs):
+    if instance.user_id is None:
+        return
+    if created:
+        if instance.is_visible and not instance.is_read and not instance.deleted:
+            increment_unread_noti_cnt([instance.user_id])
+    else:  # read, hidden or (soft) deleted
+        refresh_unread_noti_cnt([instance.user_id])
+
+
+class NotificationPush(models.Model):
+    """
+    Outbox of firebase pushes, drained by the run_push_worker command (see notification/push.py).
+    """
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='pushes')
+    # devices still to be reached on a retry; null means all active devices of the user
+    registration_ids = ArrayField(models.TextField(), null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"push of notification {self.notification_id} (attempts: {self.attempts})"
+
+
+def enqueue_pushes(notification_ids):
+    NotificationPush.objects.bulk_create([NotificationPush(notification_id=notification_id)
+                                          for notification_id in notification_ids],
+                                         batch_size=PUSH_BATCH_SIZE)
+
+
+def dispatch_notifications(notification_ids):
+    '''
+    Deliver created or aggregated notifications: right away to open sockets, through the push outbox otherwise.
+    '''
+    from notification.realtime import publish_notifications
+    enqueue_pushes(notification_ids)
+    publish_notifications(notification_ids)
 
 
 @receiver(post_save, sender=Notification)
-def cancel_firebase_notification(sender, instance, **kwargs):
-    if not instance.deleted:
+def send_firebase_notification(sender, instance, created, **kwargs):
+    if instance.deleted:
         return
+    is_any_actor_active = instance.actors.filter(deleted__isnull=True).exists()
+    if (created or (not created and instance.is_visible and not instance.is_read)) and is_any_actor_active:
+        # delivered by the push worker, so requests never wait on firebase
+        transaction.on_commit(lambda: dispatch_notifications([instance.id]))
+
 
+@task
+def send_firebase_cancel(notification_id, user_id):
     message = Message(
         data={
             'body': '삭제된 알림입니다.',
             'url': '/home',
-            'tag': str(instance.id),
+            'tag': str(notification_id),
             'type': 'cancel',
         }
     )
+    CustomFCMDevice.objects.filter(user_id=user_id).send_message(message, False)
 
-    try:
-        CustomFCMDevice.objects.filter(user_id=instance.user.id).send_message(message, False)
-    except Exception as e:
-        print("error while canceling firebase notification: ", e)
+
+@receiver(post_save, sender=Notification)
+def cancel_firebase_notification(sender, instance, **kwargs):
+    if not instance.deleted:
+        return
+    # sent by the task worker (and retried there), so deleting never waits on firebase
+    send_firebase_cancel.delay(instance.id, instance.user_id)
@@ -0,0 +1,142 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+from firebase_admin.exceptions import InvalidArgumentError
+from firebase_admin.messaging import Message, SenderIdMismatchError, UnregisteredError, send_each
+from firebase_admin.messaging import Notification as FirebaseNotification
+
+from adoorback.utils.alerts import send_msg_to_slack
+from chat import presence
+from custom_fcm.models import CustomFCMDevice
+from notification.models import NotificationPush, PUSH_BATCH_SIZE
+
+
+MAX_PUSH_ATTEMPTS = 5
+# retries wait 30s, 1m, 2m, 4m
+RETRY_BASE_SECONDS = 30
+# claimed rows are left alone this long, more than delivering a batch takes;
+# if a worker dies mid-batch, its rows are picked up again after it
+CLAIM_SECONDS = 60 * 5
+
+
+class FirebaseTransport:
+    """
+    Sends up to PUSH_BATCH_SIZE messages in one firebase request.
+    Tests can pass any object with the same send_each(messages) -> [SendResponse] method.
+    """
+
+    def send_each(self, messages):
+        return send_each(messages).responses
+
+
+def is_dead_token(exception):
+    return isinstance(exception, (UnregisteredError, SenderIdMismatchError)) or \
+        (isinstance(exception, InvalidArgumentError) and exception.cause == "Invalid registration")
+
+
+def firebase_message(instance, device):
+    body = instance.message_ko if device.language == 'ko' else instance.message_en
+    return Message(
+        notification=FirebaseNotification(
+            title='WhoAmI Today',
+            body=body
+        ),
+        data={
+            'message_en': instance.message_en,
+            'message_ko': instance.message_ko,
+            'url': instance.redirect_url,
+            'tag': str(instance.id),
+            'type': 'new',
+            'content-available': '1',  # for ios silent notification
+            'priority': 'high',  # for android
+        },
+        token=device.registration_id
+    )
+
+
+def drain_push_outbox(transport=None, limit=PUSH_BATCH_SIZE):
+    '''
+    Deliver one batch of due pushes and return how many outbox rows were handled.
+    Rows are claimed (with SKIP LOCKED, so several workers can drain the outbox side by side) in a short
+    transaction and delivered after it commits, so no transaction waits on firebase.
+    '''
+    transport = transport or FirebaseTransport()
+    with transaction.atomic():
+        pushes = list(NotificationPush.objects.select_for_update(skip_locked=True, of=('self',))
+                      .select_related('notification')
+                      .filter(next_attempt_at__lte=timezone.now())
+                      .order_by('next_attempt_at')[:limit])
+        claimed_until = timezone.now() + timedelta(seconds=CLAIM_SECONDS)
+        for push in pushes:
+            push.next_attempt_at = claimed_until
+        NotificationPush.objects.bulk_update(pushes, ['next_attempt_at'])
+
+    if pushes:
+        deliver_pushes(pushes, transport)
+    return len(pushes)
+
+
+def deliver_pushes(pushes, transport):
+    # users subscribed to the notification topic get the notification through their sockets;
+    # other sockets (chat rooms, lists) never show it, so those users still get a push
+    online = presence.online_user_ids({push.notification.user_id for push in pushes}, kinds=(presence.NOTIFICATION,))
+    devices_by_user = {}
+    for device in CustomFCMDevice.objects.filter(user_id__in={push.notification.user_id for push in pushes},
+                                                 active=True):
+        devices_by_user.setdefault(device.user_id, []).append(device)
+
+    outgoing = []  # (push, registration id, message)
+    for push in pushes:
+        noti = push.notification
+        if noti.deleted or noti.user_id in online:
+            continue
+        for device in devices_by_user.get(noti.user_id, []):
+            if push.registration_ids is None or device.registration_id in push.registration_ids:
+                outgoing.append((push, device.registration_id, firebase_message(noti, device)))
+
+    failed = {}  # push id -> registration ids to retry
+    dead_registration_ids = []
+    for i in range(0, len(outgoing), PUSH_BATCH_SIZE):
+        batch = outgoing[i:i + PUSH_BATCH_SIZE]
+        try:
+            exceptions = [response.exception for response in transport.send_each([message for _, _, message in batch])]
+        except Exception as e:
+            # the whole chunk failed (firebase, network, invalid messages, ...); earlier chunks did go out,
+            # so only this chunk's devices are retried, and attempts advance towards MAX_PUSH_ATTEMPTS
+            exceptions = [e] * len(batch)
+        for (push, registration_id, _), exception in zip(batch, exceptions):
+            if exception is None:
+                continue
+            if is_dead_token(exception):
+                dead_registration_ids.append(registration_id)
+            else:
+                failed.setdefault(push.id, []).append(registration_id)
+
+    if dead_registration_ids:
+        CustomFCMDevice.objects.filter(registration_id__in=dead_registration_ids).update(active=False)
+
+    retries, given_up = [], []
+    for push in pushes:
+        if push.id not in failed:
+            continue
+        push.attempts += 1
+        if push.attempts >= MAX_PUSH_ATTEMPTS:
+            given_up.append(push)
+            continue
+        push.registration_ids = failed[push.id]
+        push.next_attempt_at = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (push.attempts - 1))
+        retries.append(push)
+
+    retry_ids = {push.id for push in retries}
+    with transaction.atomic():
+        NotificationPush.objects.filter(id__in=[push.id for push in pushes if push.id not in retry_ids]).delete()
+        NotificationPush.objects.bulk_update(retries, ['attempts', 'registration_ids', 'next_attempt_at'])
+
+    if given_up:
+        send_msg_to_slack(
+            text=f"🚨 Gave up firebase notifications {[push.notification_id for push in given_up]} "
+                 f"after {MAX_PUSH_ATTEMPTS} attempts",
+            level="ERROR"
+        )
+
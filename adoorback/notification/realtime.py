@@ -0,0 +1,58 @@
+import asyncio
+import traceback
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+
+from adoorback.utils.alerts import send_msg_to_slack
+from chat import presence
+from chat.topics import user_group
+from notification.models import Notification
+
+
+def notification_event(noti, unread_noti_cnt):
+    return {
+        "type": "chat.message",
+        "topic": presence.NOTIFICATION,
+        "notificationId": noti.id,
+        "messageKo": noti.message_ko,
+        "messageEn": noti.message_en,
+        "redirectUrl": noti.redirect_url,
+        "updatedAt": noti.notification_updated_at.isoformat(),
+        "deltaCursor": noti.delta_cursor,
+        "unreadNotiCnt": unread_noti_cnt,
+    }
+
+
+def publish_notifications(notification_ids):
+    '''
+    Send compact events of created or aggregated notifications to the `notification` topic of their users,
+    so that open sockets don't have to poll the list or the unread count.
+    Users without a notification socket open are skipped with one presence lookup (they get a push instead),
+    so large fan-outs don't pay a channel layer round trip per recipient.
+    '''
+    notifications = list(Notification.objects.visible_only().filter(id__in=notification_ids)
+                         .only('id', 'user_id', 'message_ko', 'message_en', 'redirect_url', 'notification_updated_at',
+                               'updated_at'))
+    online = presence.online_user_ids({noti.user_id for noti in notifications}, kinds=(presence.NOTIFICATION,))
+    notifications = [noti for noti in notifications if noti.user_id in online]
+    if not notifications:
+        return
+    unread_noti_cnts = dict(get_user_model().objects.filter(id__in=online).values_list('id', 'unread_noti_cnt'))
+
+    channel_layer = get_channel_layer()
+
+    async def send_events():
+        await asyncio.gather(*(
+            channel_layer.group_send(user_group(noti.user_id, presence.NOTIFICATION),
+                                     notification_event(noti, unread_noti_cnts.get(noti.user_id, 0)))
+            for noti in notifications
+        ))
+
+    try:
+        async_to_sync(send_events)()
+    except Exception as e:
+        # clients catch up through the delta endpoint, so a failed publish must not fail the request
+        stack_trace = traceback.format_exc()
+        send_msg_to_slack(text=f"🚨 Failed to publish notifications: {e}\n```{stack_trace}```", level="WARNING")
@@ -2,13 +2,77 @@ from django.utils import timezone
 
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.utils.translation import get_language_from_request
 
-from notification.models import Notification
+from notification.models import Notification, NotificationActor
 from qna.models import Question
 
 User = get_user_model()
 
+RECENT_ACTORS_CNT = 3
+
+
+def parse_redirect_question_id(notification):
+    if notification.redirect_url[:11] == '/questions/':
+        try:
+            return int(notification.redirect_url.split('/')[-2])
+        except ValueError:
+            return None
+    return None
+
+
+def prefetch_notifications(notifications):
+    '''
+    Resolve targets, recent actors and redirect questions of notifications with a constant number of queries:
+    one in_bulk per target content type, one windowed query for actors and one in_bulk for questions.
+    '''
+    ids_by_type = {}
+    for noti in notifications:
+        if noti.target_type_id is not None and noti.target_id is not None:
+            ids_by_type.setdefault(noti.target_type_id, set()).add(noti.target_id)
+
+    targets = {}
+    for target_type_id, target_ids in ids_by_type.items():
+        model = ContentType.objects.get_for_id(target_type_id).model_class()
+        if model is None:
+            continue
+        queryset = model._base_manager.all()  # same manager as the generic foreign key
+        if any(field.name == 'question' and field.many_to_one for field in model._meta.get_fields()):
+            queryset = queryset.select_related('question')
+        for target_id, target in queryset.in_bulk(target_ids).items():
+            targets[target_type_id, target_id] = target
+    for noti in notifications:
+        target = targets.get((noti.target_type_id, noti.target_id))
+        if target is not None:
+            Notification.target.set_cached_value(noti, target)
+
+    recent_actors = {noti.id: [] for noti in notifications}
+    notification_actors = NotificationActor.objects \
+        .filter(notification_id__in=recent_actors, user__deleted__isnull=True) \
+        .annotate(rank=Window(RowNumber(), partition_by=F('notification_id'),
+                              order_by=[F('created_at').desc(), F('id').desc()])) \
+        .filter(rank__lte=RECENT_ACTORS_CNT).select_related('user').order_by('notification_id', 'rank')
+    for notification_actor in notification_actors:
+        recent_actors[notification_actor.notification_id].append(notification_actor.user)
+
+    question_ids = {parse_redirect_question_id(noti) for noti in notifications} - {None}
+    questions = Question.objects.in_bulk(question_ids) if question_ids else {}
+
+    for noti in notifications:
+        noti.prefetched_recent_actors = recent_actors[noti.id]
+        noti.prefetched_redirect_question = questions.get(parse_redirect_question_id(noti))
+
+
+class NotificationListSerializer(serializers.ListSerializer):
+
+    def to_representation(self, data):
+        notifications = list(data.all() if hasattr(data, 'all') else data)
+        prefetch_notifications(notifications)
+        return super().to_representation(notifications)
+
 
 class NotificationSerializer(serializers.ModelSerializer):
     is_response_request = serializers.SerializerMethodField(read_only=True)
@@ -18,6 +82,7 @@ class NotificationSerializer(serializers.ModelSerializer):
     recent_actors = serializers.SerializerMethodField(read_only=True)
     notification_type = serializers.SerializerMethodField(read_only=True)
     is_recent = serializers.SerializerMethodField(read_only=True)
+    delta_cursor = serializers.CharField(read_only=True)
 
     def get_is_response_request(self, obj):
         if obj.target is None:
@@ -32,10 +97,12 @@ class NotificationSerializer(serializers.ModelSerializer):
     def get_recent_actors(self, obj):
         from account.serializers import UserMinimalSerializer
 
-        if obj.target and hasattr(obj.target, '_meta') and obj.target._meta.model_name == 'ping':
-            recent_actors = obj.actors.all()[:1]
+        if hasattr(obj, 'prefetched_recent_actors'):
+            recent_actors = obj.prefetched_recent_actors
         else:
-            recent_actors = obj.actors.all()[:3]
+            recent_actors = obj.actors.order_by('-notificationactor__created_at')[:RECENT_ACTORS_CNT]
+        if obj.target and hasattr(obj.target, '_meta') and obj.target._meta.model_name == 'ping':
+            recent_actors = recent_actors[:1]
         return UserMinimalSerializer(recent_actors, many=True).data
 
     def get_notification_type(self, obj):
@@ -62,7 +129,12 @@ class NotificationSerializer(serializers.ModelSerializer):
             else:
                 content = obj.target.question.content_en  # Default to English
         elif obj.target and obj.redirect_url[:11] == '/questions/' and obj.target.type != 'Like':
-            question = Question.objects.get(id=int(obj.redirect_url.split('/')[-2]))
+            if hasattr(obj, 'prefetched_redirect_question'):
+                question = obj.prefetched_redirect_question
+                if question is None:
+                    return None
+            else:
+                question = Question.objects.get(id=parse_redirect_question_id(obj))
             request = self.context.get('request')
             lang = get_language_from_request(request) if request else 'en'
             if lang == 'en':
@@ -86,6 +158,7 @@ class NotificationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Notification
+        list_serializer_class = NotificationListSerializer
         fields = ['id', 'is_response_request', 'is_friend_request', 'recent_actors', 'notification_type', 
                   'is_recent', 'message', 'question_content', 'is_read', 'created_at', 'redirect_url',
-                  'notification_updated_at']
+                  'notification_updated_at', 'delta_cursor']
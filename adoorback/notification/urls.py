@@ -4,6 +4,7 @@ from notification import views
 
 urlpatterns = [
     path('', views.NotificationList.as_view(), name='notification-list'),
+    path('delta/', views.NotificationDelta.as_view(), name='notification-delta'),
     path('friend-requests/', views.FriendRequestNotiList.as_view(), name='friend-request-noti-list'),
     path('response-requests/', views.ResponseRequestNotiList.as_view(), name='response-request-noti-list'),
     path('read/', views.NotificationDetail.as_view(), name='notification-read'),
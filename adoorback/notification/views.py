@@ -1,20 +1,35 @@
+from datetime import timedelta, timezone as dt_timezone
+
 from django.db import transaction
-from django.utils import translation
+from django.db.models import Exists, OuterRef, Q, Subquery
+from django.utils import timezone, translation
+from django.utils.dateparse import parse_datetime
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from notification.models import Notification
+from notification.models import Notification, NOTIFICATION_RETENTION_DAYS, refresh_unread_noti_cnt
 from notification.serializers import NotificationSerializer
+from qna.models import Response as QnaResponse, ResponseRequest
 
+from adoorback.utils.pagination import OptInCursorPagination
 from adoorback.utils.permissions import IsOwnerOrReadOnly
 from adoorback.utils.validators import adoor_exception_handler
 from adoorback.utils.content_types import get_friend_request_type, get_response_request_type
 
 
+NOTIFICATION_DELTA_SIZE = 100
+
+
+class NotificationPagination(OptInCursorPagination):
+    ordering = ('-notification_updated_at', '-id')
+
+
 class NotificationList(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
 
     def get_exception_handler(self):
         return adoor_exception_handler
@@ -30,9 +45,74 @@ class NotificationList(generics.ListAPIView):
         return notifications
 
 
+class NotificationDelta(generics.GenericAPIView):
+    '''
+    Notifications changed since a `since=<updated_at>,<id>` cursor, oldest change first, for clients catching up
+    after a reconnect. `delta_cursor` of listed notifications and socket events (`deltaCursor`) is such a cursor.
+    Read / hidden / deleted changes count too: hidden and deleted ones are listed in removed_ids.
+    Every change bumps updated_at (queryset updates set it explicitly, removals are soft deletes), but rows are
+    hard deleted after NOTIFICATION_RETENTION_DAYS: for older cursors the response only has `full_refetch: true`,
+    and the client must reload the lists and take a new cursor from them.
+    '''
+    serializer_class = NotificationSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_exception_handler(self):
+        return adoor_exception_handler
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        since_updated_at, since_id = self.parse_since(request.query_params.get('since', ''))
+        if since_updated_at < timezone.now() - timedelta(days=NOTIFICATION_RETENTION_DAYS):
+            return Response({
+                'results': [],
+                'removed_ids': [],
+                'next_since': None,
+                'has_more': False,
+                'full_refetch': True,
+                'unread_noti_cnt': user.unread_noti_cnt,
+            })
+
+        notifications = Notification.all_objects.filter(user=user).filter(
+            Q(updated_at__gt=since_updated_at) | Q(updated_at=since_updated_at, id__gt=since_id)
+        )
+        if user.ver_changed_at:
+            notifications = notifications.filter(created_at__gte=user.ver_changed_at)
+        notifications = list(notifications.order_by('updated_at', 'id')[:NOTIFICATION_DELTA_SIZE + 1])
+
+        has_more = len(notifications) > NOTIFICATION_DELTA_SIZE
+        notifications = notifications[:NOTIFICATION_DELTA_SIZE]
+        changed = [noti for noti in notifications if noti.is_visible and not noti.deleted]
+        if notifications:
+            next_since = notifications[-1].delta_cursor
+        else:
+            next_since = f'{since_updated_at.isoformat()},{since_id}'
+
+        return Response({
+            'results': self.get_serializer(changed, many=True).data,
+            'removed_ids': [noti.id for noti in notifications if not (noti.is_visible and not noti.deleted)],
+            'next_since': next_since,
+            'has_more': has_more,
+            'full_refetch': False,
+            'unread_noti_cnt': user.unread_noti_cnt,
+        })
+
+    @staticmethod
+    def parse_since(since):
+        updated_at, _, noti_id = since.rpartition(',')
+        # an unencoded '+' of the utc offset arrives as a space
+        updated_at = parse_datetime(updated_at.replace(' ', '+')) if updated_at else None
+        if updated_at is None or not noti_id.isdigit():
+            raise ValidationError({'since': 'since must be "<updated_at>,<id>".'})
+        if timezone.is_naive(updated_at):
+            updated_at = updated_at.replace(tzinfo=dt_timezone.utc)
+        return updated_at, int(noti_id)
+
+
 class FriendRequestNotiList(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
 
     def get_exception_handler(self):
         return adoor_exception_handler
@@ -45,6 +125,7 @@ class FriendRequestNotiList(generics.ListAPIView):
 class ResponseRequestNotiList(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NotificationPagination
 
     def get_exception_handler(self):
         return adoor_exception_handler
@@ -54,13 +135,12 @@ class ResponseRequestNotiList(generics.ListAPIView):
         current_user = self.request.user
         queryset = Notification.objects.visible_only().filter(target_type=get_response_request_type(), user=current_user)
 
-        # filter out answered response-requests
-        filtered_queryset = []
-        for noti in queryset:
-            response = noti.target.question.response_set.filter(author=current_user).filter(created_at__gt=noti.notification_updated_at)
-            if not response.exists():
-                filtered_queryset.append(noti)
-        return filtered_queryset
+        # filter out answered response-requests (answered after the request was last updated)
+        request_question_id = ResponseRequest.all_objects.filter(id=OuterRef('target_id')).values('question_id')[:1]
+        answered = QnaResponse.objects.filter(author=current_user,
+                                              question_id=OuterRef('request_question_id'),
+                                              created_at__gt=OuterRef('notification_updated_at'))
+        return queryset.annotate(request_question_id=Subquery(request_question_id)).filter(~Exists(answered))
 
 
 class NotificationDetail(generics.UpdateAPIView):
@@ -74,7 +154,8 @@ class NotificationDetail(generics.UpdateAPIView):
     def patch(self, request, *args, **kwargs):
         ids = request.data.get('ids', [])
         queryset = Notification.objects.filter(id__in=ids)
-        queryset.update(is_read=True)
+        queryset.update(is_read=True, updated_at=timezone.now())
+        refresh_unread_noti_cnt(set(queryset.values_list('user_id', flat=True)))
         serializer = self.get_serializer(queryset, many=True)
 
         return Response(serializer.data)
@@ -90,6 +171,7 @@ class MarkAllNotificationsRead(generics.GenericAPIView):
     def patch(self, request, *args, **kwargs):
         user = request.user
         notifications = Notification.objects.unread_only(user=user)
-        notifications.update(is_read=True)
+        notifications.update(is_read=True, updated_at=timezone.now())
+        refresh_unread_noti_cnt([user.id])
         
         return Response(status=200)
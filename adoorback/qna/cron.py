@@ -6,7 +6,7 @@ from qna.algorithms.recommender import create_ranks_csv
 
 
 class DailyQuestionCronJob(CronJobBase):
-    schedule = Schedule(run_every_mins=0)
+    schedule = Schedule(run_at_times=['08:00'])  # TIME_ZONE
 
     code = 'qna.algorithms.data_crawler.select_daily_questions'
 
@@ -21,6 +21,7 @@ from content_report.models import ContentReport
 from like.models import Like
 from notification.models import Notification, NotificationActor
 from reaction.models import Reaction
+from task.queue import task
 
 User = get_user_model()
 
@@ -274,28 +275,30 @@ def add_author_to_readers(instance, created, **kwargs):
     instance.save()
 
 
+@task
+def notify_subscribers(post_id):
+    post = Response.objects.select_related('author').filter(id=post_id).first()
+    if post is None:
+        return  # deleted before the task ran
+    author = post.author
+    notifications = [
+        Notification(
+            user_id=subscriber_id,
+            origin=post,
+            target=post,
+            message_ko=f'{author.username}님이 새 답변을 작성했습니다.',
+            message_en=f'{author.username} has posted a new response.',
+            redirect_url=f'/responses/{post.id}'
+        )
+        for subscriber_id in Subscription.audience_subscriber_ids(post)
+    ]
+    if notifications:
+        Notification.objects.bulk_create_notifications(author, notifications)
+
+
 @receiver(post_save, sender=Response)
 def send_notifications_to_subscribers(sender, instance, created, **kwargs):
     if not created:
         return
-
-    author = instance.author
-    response_content_type = ContentType.objects.get_for_model(Response)
-    
-    subscribers = Subscription.objects.filter(
-        subscribed_to=author,
-        content_type=response_content_type,
-    ).values_list('subscriber', flat=True)
-
-    for subscriber_id in subscribers:
-        subscriber = get_user_model().objects.get(id=subscriber_id)
-        
-        noti = Notification.objects.create(
-            user=subscriber,
-            origin=instance,
-            target=instance,
-            message_ko=f'{author.username}님이 새 답변을 작성했습니다.',
-            message_en=f'{author.username} has posted a new response.',
-            redirect_url=f'/responses/{instance.id}'
-        )
-        NotificationActor.objects.create(user=author, notification=noti)
+    # fanned out by the task worker, outside of the request's save transaction
+    notify_subscribers.delay(instance.id)
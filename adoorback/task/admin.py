@@ -0,0 +1,7 @@
+from django.contrib import admin
+
+from .models import OutboundEmail, Task
+
+
+admin.site.register(Task)
+admin.site.register(OutboundEmail)
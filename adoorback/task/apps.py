@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class TaskConfig(AppConfig):
+    name = 'task'
+    default_auto_field = 'django.db.models.AutoField'
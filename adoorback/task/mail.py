@@ -0,0 +1,79 @@
+import traceback
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from adoorback.utils.alerts import send_msg_to_slack
+from task.models import OutboundEmail
+
+
+EMAIL_BATCH_SIZE = 50
+MAX_EMAIL_ATTEMPTS = 5
+# retries wait 1m, 2m, 4m, 8m
+RETRY_BASE_SECONDS = 60
+# claimed rows are left alone this long, more than a batch takes with EMAIL_TIMEOUT;
+# if a worker dies mid-batch, its rows are picked up again after it
+CLAIM_SECONDS = 60 * 15
+
+
+def queue_email(subject, body, to, from_email=None):
+    '''
+    Queue an email for the email worker once the current transaction commits,
+    so that requests never wait on an SMTP round trip.
+    '''
+    transaction.on_commit(lambda: OutboundEmail.objects.create(
+        subject=str(subject), body=str(body), to=list(to), from_email=from_email))
+
+
+def send_queued_emails(limit=EMAIL_BATCH_SIZE):
+    '''
+    Send one batch of due emails over a single SMTP connection and return how many were handled.
+    Rows are claimed (with SKIP LOCKED, so several workers can run side by side) in a short transaction,
+    sent outside of it, and their results are recorded in a second one, so no transaction waits on SMTP.
+    Each email is sent on its own, so a rejected address only fails (and retries) its own row.
+    '''
+    with transaction.atomic():
+        emails = list(OutboundEmail.objects.select_for_update(skip_locked=True)
+                      .filter(send_at__lte=timezone.now())
+                      .order_by('send_at')[:limit])
+        if not emails:
+            return 0
+        for email in emails:
+            email.attempts += 1
+            email.send_at = timezone.now() + timedelta(seconds=CLAIM_SECONDS)
+        OutboundEmail.objects.bulk_update(emails, ['attempts', 'send_at'])
+
+    sent, retries, given_up = [], [], []
+    connection = get_connection()
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+            try:
+                message.send()
+            except Exception:
+                # the connection may be broken now; the next send opens a fresh one
+                connection.close()
+                email.last_error = traceback.format_exc()
+                if email.attempts >= MAX_EMAIL_ATTEMPTS:
+                    given_up.append(email)
+                    continue
+                email.send_at = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (email.attempts - 1))
+                retries.append(email)
+            else:
+                sent.append(email)
+    finally:
+        connection.close()
+
+    with transaction.atomic():
+        OutboundEmail.objects.filter(id__in=[email.id for email in sent + given_up]).delete()
+        OutboundEmail.objects.bulk_update(retries, ['last_error', 'send_at'])
+
+    for email in given_up:
+        send_msg_to_slack(
+            text=f"*⚠️ 이메일 전송 실패* '{email.subject}' to {', '.join(email.to)} "
+                 f"after {MAX_EMAIL_ATTEMPTS} attempts\n```{email.last_error}```",
+            level="WARNING"
+        )
+    return len(emails)
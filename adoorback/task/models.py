@@ -0,0 +1,35 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Task(models.Model):
+    """
+    Queue of deferred work, enqueued after commit (see task/queue.py) and run by the run_task_worker command.
+    """
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    attempts = models.IntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"task {self.name} (id: {self.id}, attempts: {self.attempts})"
+
+
+class OutboundEmail(models.Model):
+    """
+    Outbox of emails, queued after commit (see task/mail.py) and sent by the run_email_worker command.
+    """
+    subject = models.CharField(max_length=300)
+    body = models.TextField()
+    to = models.JSONField(default=list)
+    from_email = models.CharField(max_length=254, null=True, blank=True)  # None: DEFAULT_FROM_EMAIL
+    attempts = models.IntegerField(default=0)
+    send_at = models.DateTimeField(default=timezone.now, db_index=True)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"email '{self.subject}' to {', '.join(self.to)} (id: {self.id}, attempts: {self.attempts})"
@@ -0,0 +1,85 @@
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from adoorback.utils.alerts import send_msg_to_slack
+from task.models import Task
+
+
+TASK_BATCH_SIZE = 20
+MAX_TASK_ATTEMPTS = 5
+# retries wait 30s, 1m, 2m, 4m
+RETRY_BASE_SECONDS = 30
+# claimed rows are left alone this long, more than running a batch takes;
+# if a worker dies mid-batch, its rows are picked up again after it
+CLAIM_SECONDS = 60 * 15
+
+_tasks = {}  # task name -> function
+
+
+def task(func):
+    """
+    Register func as a task. func.delay(*args, **kwargs) runs it in the task worker once the current
+    transaction commits (args must be json serializable, so pass ids rather than model instances).
+    With settings.TASKS_EAGER (e.g. in tests) it runs right away instead.
+    """
+    name = f'{func.__module__}.{func.__name__}'
+    _tasks[name] = func
+
+    def delay(*args, **kwargs):
+        if settings.TASKS_EAGER:
+            return func(*args, **kwargs)
+        transaction.on_commit(lambda: Task.objects.create(name=name, args=list(args), kwargs=kwargs))
+
+    func.delay = delay
+    return func
+
+
+def run_due_tasks(limit=TASK_BATCH_SIZE):
+    '''
+    Run one batch of due tasks and return how many were handled.
+    Rows are claimed (with SKIP LOCKED, so several workers can run side by side) in a short transaction,
+    each task then runs in a transaction of its own, so a slow or failing task holds no locks on the others,
+    and the results are recorded in a second short transaction.
+    '''
+    with transaction.atomic():
+        tasks = list(Task.objects.select_for_update(skip_locked=True)
+                     .filter(run_at__lte=timezone.now())
+                     .order_by('run_at')[:limit])
+        if not tasks:
+            return 0
+        claimed_until = timezone.now() + timedelta(seconds=CLAIM_SECONDS)
+        for queued in tasks:
+            queued.attempts += 1
+            queued.run_at = claimed_until
+        Task.objects.bulk_update(tasks, ['attempts', 'run_at'])
+
+    done, retries, given_up = [], [], []
+    for queued in tasks:
+        try:
+            with transaction.atomic():
+                _tasks[queued.name](*queued.args, **queued.kwargs)
+        except Exception:
+            queued.last_error = traceback.format_exc()
+            if queued.attempts >= MAX_TASK_ATTEMPTS:
+                given_up.append(queued)
+                continue
+            queued.run_at = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (queued.attempts - 1))
+            retries.append(queued)
+        else:
+            done.append(queued)
+
+    with transaction.atomic():
+        Task.objects.filter(id__in=[queued.id for queued in done + given_up]).delete()
+        Task.objects.bulk_update(retries, ['last_error', 'run_at'])
+
+    for queued in given_up:
+        send_msg_to_slack(
+            text=f"🚨 Gave up task {queued.name} (args: {queued.args}, kwargs: {queued.kwargs}) "
+                 f"after {MAX_TASK_ATTEMPTS} attempts\n```{queued.last_error}```",
+            level="ERROR"
+        )
+    return len(tasks)
@@ -1,14 +1,12 @@
 from django.contrib.contenttypes.fields import GenericForeignKey
-from django.db import models, transaction
+from django.db import models
 from django.contrib.contenttypes.fields import GenericRelation
 from django.contrib.contenttypes.models import ContentType
-from django.db.models.signals import post_save
-from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 
 from adoorback.models import AdoorTimestampedModel
-from notification.models import Notification, NotificationActor
+from notification.models import Notification
 from adoorback.utils.content_types import get_generic_relation_type
 
 User = get_user_model()
@@ -53,46 +51,42 @@ class UserTag(AdoorTimestampedModel):
         return self.__class__.__name__
 
 
-@transaction.atomic
-@receiver(post_save, sender=UserTag)
-def create_user_tag_noti(instance, **kwargs):
-    user = instance.tagged_user
-    actor = instance.tagging_user
-    origin = instance.target
-    target = instance
-
-    if user == actor:
-        return
-
-    if actor.id in user.user_report_blocked_ids:  # do not create notification from/for blocked user
-        return
-
-    actor_name = f'{actor.username}님이'
-
-    if origin.type == 'Comment':
-        if origin.target.type == 'Comment':  # if is reply
-            post = origin.target.target
-            message = f'{actor_name} 댓글에서 회원님을 언급했습니다.'
-        else:
-            post = origin.target
-            message = f'{actor_name} 댓글에서 회원님을 언급했습니다.'
-        if origin.target.author == user:
-            return  # do not create noti if comment / reply notification will be sent
-        if origin.is_private and origin.target.author != user:
-            return  # do not create noti for private comment that tagged user has no permission to see
-        redirect_url = f'/{post.type.lower()}s/' \
-                       f'{post.id}'
+def create_comment_user_tag_notis(comment, user_tags):
+    """
+    Notify the users tagged in comment by user_tags, which were bulk created together
+    (so no post_save was sent for them).
+    """
+    actor = comment.author
+    if comment.is_private:
+        return  # do not create noti for private comment that tagged user has no permission to see
+
+    if comment.target.type == 'Comment':  # if is reply
+        post = comment.target.target
     else:
-        print("UserTag can only be created in comment or reply for now.")
-        return
-
-    notification = Notification.objects.filter(actors__id=actor.id,
-                                               user=user,
-                                               origin_id=origin.id,
-                                               origin_type=get_generic_relation_type(origin.type))
-
-    if notification.count() == 0:  # create only one notification when user was tagged twice in the same comment
-        noti = Notification.objects.create(user=user,
-                                           origin=origin, target=target,
-                                           message=message, redirect_url=redirect_url)
-        NotificationActor.objects.create(user=actor, notification=noti)
+        post = comment.target
+    message = f'{actor.username}님이 댓글에서 회원님을 언급했습니다.'
+    redirect_url = f'/{post.type.lower()}s/{post.id}'
+    origin_type = get_generic_relation_type(comment.type)
+
+    tagged_user_ids = {user_tag.tagged_user_id for user_tag in user_tags}
+    blocked_ids = set(actor.user_report_blocked_ids)  # do not create notification from/for blocked user
+    # create only one notification when user was tagged twice in the same comment
+    notified_ids = set(Notification.objects.filter(actors__id=actor.id,
+                                                   user_id__in=tagged_user_ids,
+                                                   origin_id=comment.id,
+                                                   origin_type=origin_type).values_list('user_id', flat=True))
+
+    notifications = []
+    for user_tag in user_tags:
+        user_id = user_tag.tagged_user_id
+        if user_id == actor.id or user_id in blocked_ids or user_id in notified_ids:
+            continue
+        if user_id == comment.target.author_id:
+            continue  # do not create noti if comment / reply notification will be sent
+        notified_ids.add(user_id)
+        notifications.append(Notification(user_id=user_id,
+                                          origin=comment, target=user_tag,
+                                          message=message, redirect_url=redirect_url))
+
+    if notifications:
+        Notification.objects.bulk_create_notifications(actor, notifications)
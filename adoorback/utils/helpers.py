@@ -1,32 +1,65 @@
-from itertools import chain
+import atexit
 import re
+import threading
+import traceback
 
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
 from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
 
+from adoorback.utils.alerts import send_msg_to_slack
 from adoorback.utils.validators import USERNAME_REGEX
-from chat.models import UserChatActivity
+from chat import presence
+from chat.models import ChatRoom, UserChatActivity
+from chat.topics import room_group, room_topic, user_group
 
 User = get_user_model()
 
+# buffered last read updates are written at most this long after the message arrived
+LAST_READ_FLUSH_SECONDS = 5
+
+# only advances last_read_message_id; `previous` is the pre-update snapshot of the same row,
+# so the old id can be returned to build read receipt deltas
+LAST_READ_UPDATE_SQL = '''
+    UPDATE {table} AS activity
+    SET last_read_message_id = GREATEST(COALESCE(activity.last_read_message_id, 0), buffered.message_id),
+        updated_at = NOW()
+    FROM {table} AS previous, (VALUES {values}) AS buffered (user_id, chat_room_id, message_id)
+    WHERE previous.id = activity.id
+        AND activity.user_id = buffered.user_id
+        AND activity.chat_room_id = buffered.chat_room_id
+        AND activity.deleted IS NULL
+        AND buffered.message_id > COALESCE(activity.last_read_message_id, 0)
+    RETURNING activity.user_id, activity.chat_room_id, previous.last_read_message_id, activity.last_read_message_id
+'''
+
+_last_read_buffer = {}
+_last_read_lock = threading.Lock()
+_last_read_timer = None
+
 
 def parse_user_tag_from_content(content):
-    tagged_users = User.objects.none()
+    tagged_users = []
     word_indices = []
     if not '@' in content:
         return tagged_users, word_indices
 
+    tagged_usernames = {}  # word index -> username
     words = content.split(' ')
     for i, word in enumerate(words):
         if len(word) == 0 or word[0] != '@':
             continue
 
         # cut username by regex (exclude unallowed characters)
-        tagged_username = re.compile(USERNAME_REGEX[1:-2]).match(word[1:]).group()
-        try:
-            tagged_users = list(chain(tagged_users, User.objects.filter(username=tagged_username)))
+        tagged_usernames[i] = re.compile(USERNAME_REGEX[1:-2]).match(word[1:]).group()
+
+    # resolve all tagged names in one query; names of nonexistent users are skipped
+    users = {user.username: user for user in User.objects.filter(username__in=set(tagged_usernames.values()))}
+    for i, tagged_username in tagged_usernames.items():
+        if tagged_username in users:
+            tagged_users.append(users[tagged_username])
             word_indices.append(i)
-        except User.DoesNotExist:
-            continue
 
     return tagged_users, word_indices
 
@@ -34,7 +67,143 @@ def parse_user_tag_from_content(content):
 def update_last_read_message(user, chat_room):
     last_message = chat_room.messages.last()
     user_activity, _ = UserChatActivity.objects.get_or_create(user=user, chat_room=chat_room)
+    previous_message_id = user_activity.last_read_message_id
     user_activity.last_read_message = last_message
     user_activity.save()
 
+    if last_message and (previous_message_id is None or last_message.id > previous_message_id):
+        send_read_receipt_delta(user.id, chat_room.id, previous_message_id, last_message.id)
+
     return
+
+
+def send_read_receipt_delta(user_id, chat_room_id, from_message_id, to_message_id):
+    # push the newly read range so open room sockets can bump read receipts without refetching
+    async_to_sync(get_channel_layer().group_send)(
+        room_group(chat_room_id), {
+            "type": "chat.read",
+            "topic": room_topic(chat_room_id),
+            "userId": user_id,
+            "fromMessageId": from_message_id,
+            "toMessageId": to_message_id,
+        }
+    )
+
+
+def buffer_last_read_message(user_id, chat_room_id, message_id):
+    '''
+    Record that user read message_id in chat_room without writing it yet.
+    Only the highest id per (user, chat room) is kept, and the buffer is flushed in one statement
+    LAST_READ_FLUSH_SECONDS later (or earlier through flush_last_read_messages, e.g. when a room socket closes).
+    '''
+    _merge_last_read_messages([((int(user_id), int(chat_room_id)), message_id)])
+
+
+def _merge_last_read_messages(reads):
+    global _last_read_timer
+    with _last_read_lock:
+        for key, message_id in reads:
+            if message_id > _last_read_buffer.get(key, 0):
+                _last_read_buffer[key] = message_id
+        if _last_read_timer is None:
+            _last_read_timer = threading.Timer(LAST_READ_FLUSH_SECONDS, _flush_last_read_messages_from_timer)
+            _last_read_timer.daemon = True
+            _last_read_timer.start()
+
+
+def _flush_last_read_messages_from_timer():
+    try:
+        flush_last_read_messages()
+    finally:
+        connection.close()  # the timer thread opened its own connection
+
+
+@atexit.register
+def _flush_last_read_messages_at_exit():
+    # the timer thread is a daemon, so reads buffered when a worker shuts down are written here
+    try:
+        flush_last_read_messages()
+    except Exception as e:
+        stack_trace = traceback.format_exc()
+        send_msg_to_slack(text=f"🚨 Failed to flush buffered read positions on shutdown: {e}\n```{stack_trace}```",
+                          level="ERROR")
+    # a failed flush puts its batch back, but no timer runs after shutdown to retry it
+    with _last_read_lock:
+        lost = len(_last_read_buffer)
+    if lost:
+        send_msg_to_slack(text=f"🚨 Lost {lost} buffered read position(s) on shutdown", level="ERROR")
+
+
+def flush_last_read_messages():
+    global _last_read_timer
+    with _last_read_lock:
+        buffered = list(_last_read_buffer.items())
+        _last_read_buffer.clear()
+        if _last_read_timer is not None:
+            _last_read_timer.cancel()
+            _last_read_timer = None
+
+    if not buffered:
+        return
+
+    params = []
+    for (user_id, chat_room_id), message_id in buffered:
+        params += [user_id, chat_room_id, message_id]
+    sql = LAST_READ_UPDATE_SQL.format(table=UserChatActivity._meta.db_table,
+                                      values=', '.join(['(%s, %s, %s)'] * len(buffered)))
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            updated = cursor.fetchall()
+    except DatabaseError as e:
+        # put the batch back (newer reads buffered meanwhile win), so the next flush writes it
+        _merge_last_read_messages(buffered)
+        send_msg_to_slack(text=f"⚠️ Failed to flush {len(buffered)} buffered read positions, retrying: {e}",
+                          level="WARNING")
+        return
+
+    for user_id, chat_room_id, from_message_id, to_message_id in updated:
+        send_read_receipt_delta(user_id, chat_room_id, from_message_id, to_message_id)
+    send_unread_cnt_updates([(user_id, chat_room_id) for user_id, chat_room_id, _, _ in updated])
+
+
+def send_unread_cnt_updates(user_rooms):
+    '''
+    Push fresh unread counts of (user, chat room) pairs whose read position was just written:
+    counts sent to chat_list / chat_icon sockets while the read was still buffered were computed from the old position.
+    '''
+    from chat.consumers import TIME_FORMAT
+
+    if not user_rooms:
+        return
+    channel_layer = get_channel_layer()
+    users = User.objects.in_bulk({user_id for user_id, _ in user_rooms})
+    chat_rooms = ChatRoom.objects.in_bulk({chat_room_id for _, chat_room_id in user_rooms})
+
+    for user_id, chat_room_id in user_rooms:
+        user, chat_room = users.get(user_id), chat_rooms.get(chat_room_id)
+        if user is None or chat_room is None or not presence.has_sockets(user_id, presence.CHAT_LIST):
+            continue
+        last_message = chat_room.messages.last()
+        if last_message is None:
+            continue
+        async_to_sync(channel_layer.group_send)(
+            user_group(user_id, presence.CHAT_LIST), {
+                "type": "chat.message",
+                "topic": presence.CHAT_LIST,
+                "roomId": chat_room_id,
+                "content": last_message.content,
+                "timestamp": last_message.timestamp.strftime(TIME_FORMAT),
+                "unreadCnt": chat_room.unread_cnt(user)
+            }
+        )
+
+    for user_id, user in users.items():
+        if presence.has_sockets(user_id, presence.CHAT_ICON):
+            async_to_sync(channel_layer.group_send)(
+                user_group(user_id, presence.CHAT_ICON), {
+                    "type": "chat.message",
+                    "topic": presence.CHAT_ICON,
+                    "unreadCnt": user.unread_message_cnt
+                }
+            )